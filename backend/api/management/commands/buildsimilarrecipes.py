@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.similar import rebuild_similar_recipes
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the precomputed similar recipes for the whole catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Количество записей в одной пачке bulk_create.',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = rebuild_similar_recipes(options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Похожие рецепты пересчитаны.\nЗаписей: {created}'
+            )
+        )
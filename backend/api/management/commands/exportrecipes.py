@@ -0,0 +1,78 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+
+from recipes.models import Recipe, RecipeIngredient
+
+
+def serialize_recipe(recipe):
+    return {
+        'author': recipe.author.email,
+        'name': recipe.name,
+        'text': recipe.text,
+        'image': recipe.image.name,
+        'image_variants': recipe.image_variants,
+        'cooking_time': recipe.cooking_time,
+        'pub_date': recipe.pub_date.isoformat(),
+        'tags': [tag.slug for tag in recipe.tags.all()],
+        'ingredients': [
+            {
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.ingredients.all()
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Exports recipes with tags and ingredients to a JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Путь к JSONL файлу, "-" для вывода в stdout.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество рецептов, читаемых из базы за один раз.',
+        )
+
+    def handle(self, *args, **options):
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient'),
+            ),
+        ).order_by('id')
+        output = sys.stdout if options['path'] == '-' else open(
+            options['path'], 'w', encoding='utf-8'
+        )
+        exported = 0
+        last_id = 0
+        try:
+            while True:
+                batch = list(
+                    queryset.filter(id__gt=last_id)[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                output.writelines(
+                    json.dumps(serialize_recipe(recipe), ensure_ascii=False)
+                    + '\n'
+                    for recipe in batch
+                )
+                exported += len(batch)
+                last_id = batch[-1].id
+                self.stderr.write(f'Выгружено рецептов: {exported}')
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.stderr.write(
+            self.style.SUCCESS(f'Экспорт закончен. Рецептов: {exported}')
+        )
@@ -0,0 +1,159 @@
+import json
+import sys
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from recipes.counters import reconcile_counters
+from recipes.feed import fill_timelines
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.pantry_index import reset_pantry_index
+from recipes.similar import add_similar_recipes
+from recipes.versions import bump_version
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Imports recipes with tags and ingredients from a JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Путь к JSONL файлу, "-" для чтения из stdin.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество рецептов в одной пачке bulk_create.',
+        )
+
+    def handle(self, *args, **options):
+        self.authors = {}
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {}
+        imported = skipped = 0
+        source = sys.stdin if options['path'] == '-' else open(
+            options['path'], encoding='utf-8'
+        )
+        try:
+            lines = (line for line in source if line.strip())
+            while True:
+                batch = [
+                    json.loads(line)
+                    for line in islice(lines, options['batch_size'])
+                ]
+                if not batch:
+                    break
+                with transaction.atomic():
+                    recipe_ids = self.import_batch(batch)
+                add_similar_recipes(recipe_ids)
+                imported += len(recipe_ids)
+                skipped += len(batch) - len(recipe_ids)
+                self.stdout.write(f'Загружено рецептов: {imported}')
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        reconcile_counters()
+        reset_pantry_index()
+        for model in (Recipe, RecipeIngredient, Ingredient):
+            bump_version(model)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Импорт закончен.\n'
+                f'Загружено рецептов: {imported}\n'
+                f'Пропущено рецептов: {skipped}'
+            )
+        )
+
+    def resolve_authors(self, batch):
+        missing = {row['author'] for row in batch} - self.authors.keys()
+        if missing:
+            self.authors.update(
+                User.objects.filter(email__in=missing).values_list(
+                    'email', 'id'
+                )
+            )
+
+    def resolve_ingredients(self, batch):
+        keys = {
+            (item['name'], item['measurement_unit'])
+            for row in batch for item in row['ingredients']
+        } - self.ingredients.keys()
+        if not keys:
+            return
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in keys
+            ),
+            ignore_conflicts=True,
+        )
+        names = {name for name, _ in keys}
+        for ingredient_id, name, measurement_unit in (
+                Ingredient.objects.filter(name__in=names).values_list(
+                    'id', 'name', 'measurement_unit'
+                )
+        ):
+            self.ingredients[name, measurement_unit] = ingredient_id
+
+    def import_batch(self, batch):
+        self.resolve_authors(batch)
+        self.resolve_ingredients(batch)
+        rows = []
+        for row in batch:
+            if row['author'] not in self.authors:
+                self.stderr.write(
+                    self.style.WARNING(
+                        f'Рецепт "{row["name"]}" пропущен: '
+                        f'нет автора {row["author"]}.'
+                    )
+                )
+                continue
+            unknown_tags = set(row['tags']) - self.tags.keys()
+            if unknown_tags:
+                raise CommandError(f'Неизвестные теги: {unknown_tags}')
+            rows.append(row)
+        recipes = [
+            Recipe(
+                author_id=self.authors[row['author']],
+                name=row['name'],
+                text=row['text'],
+                image=row['image'],
+                image_variants=row.get('image_variants') or {},
+                cooking_time=row['cooking_time'],
+            )
+            for row in rows
+        ]
+        Recipe.objects.bulk_create(recipes)
+        if not connection.features.can_return_rows_from_bulk_insert:
+            # SQLite не возвращает id из bulk_create, но в транзакции
+            # вставленные строки получают последние id подряд.
+            ids = Recipe.objects.order_by('-id').values_list(
+                'id', flat=True
+            )[:len(recipes)]
+            for recipe, recipe_id in zip(recipes, list(ids)[::-1]):
+                recipe.id = recipe_id
+        for recipe, row in zip(recipes, rows):
+            recipe.pub_date = parse_datetime(row['pub_date'])
+        Recipe.objects.bulk_update(recipes, ['pub_date'])
+        fill_timelines(recipe_ids=[recipe.id for recipe in recipes])
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=self.tags[slug])
+            for recipe, row in zip(recipes, rows) for slug in row['tags']
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe_id=recipe.id,
+                ingredient_id=self.ingredients[
+                    item['name'], item['measurement_unit']
+                ],
+                amount=item['amount'],
+            )
+            for recipe, row in zip(recipes, rows)
+            for item in row['ingredients']
+        )
+        return [recipe.id for recipe in recipes]
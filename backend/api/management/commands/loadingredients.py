@@ -1,49 +1,132 @@
 import csv
+import json
 import os.path
+from itertools import islice
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 
 from recipes.models import Ingredient
+from recipes.versions import bump_version
+
+FIELDS = ('name', 'measurement_unit')
+FORMATS = ('csv', 'json', 'jsonl')
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    csv_reader = csv.DictReader(file)
+    if csv_reader.fieldnames is None or len(csv_reader.fieldnames) != 2 or (
+            any(field not in csv_reader.fieldnames for field in FIELDS)
+    ):
+        raise CommandError(
+            'csv файл должен содержать две колонки: '
+            '"name" и "measurement_unit"'
+        )
+    yield from csv_reader
+
+
+def read_json(file):
+    """Разбирает JSON-массив по одному элементу, читая файл частями."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    expected = '['
+    while True:
+        chunk = file.read(JSON_CHUNK_SIZE)
+        buffer = (buffer + chunk).lstrip()
+        while buffer:
+            if expected in ('[', ','):
+                if buffer[0] == ']' and expected == ',':
+                    return
+                if buffer[0] != expected:
+                    raise CommandError(
+                        'json файл должен содержать массив объектов'
+                    )
+                expected = 'item or ]' if expected == '[' else 'item'
+                buffer = buffer[1:].lstrip()
+                continue
+            if buffer[0] == ']' and expected == 'item or ]':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise CommandError('Некорректный json файл')
+                break
+            if end == len(buffer) and chunk:
+                break
+            yield item
+            buffer = buffer[end:].lstrip()
+            expected = ','
+        if not chunk:
+            raise CommandError('json файл оборван')
+
+
+def read_jsonl(file):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+READERS = {'csv': read_csv, 'json': read_json, 'jsonl': read_jsonl}
 
 
 class Command(BaseCommand):
-    help = 'Imports ingredients from data/ingredients.csv to the database'
+    help = 'Imports ingredients from a CSV, JSON or JSONL file to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=settings.BASE_DIR / 'data/ingredients.csv',
+            help='Путь к файлу, по умолчанию data/ingredients.csv.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат файла, по умолчанию определяется по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Количество строк в одной пачке bulk_create.',
+        )
 
     def handle(self, *args, **options):
-        file = settings.BASE_DIR / 'data/ingredients.csv'
+        file = options['path']
         if not os.path.isfile(file):
             raise CommandError(f"Отсутствует файл: {file}")
-        objects = []
-        skipped_ingredients = 0
+        file_format = options['format'] or (
+            os.path.splitext(str(file))[1].lstrip('.').lower()
+        )
+        if file_format not in READERS:
+            raise CommandError(
+                f'Неизвестный формат файла: {file_format}. '
+                f'Укажите --format {"/".join(FORMATS)}'
+            )
+        initial_count = Ingredient.objects.count()
+        processed = 0
         with open(file, encoding='utf-8') as f:
-            csv_reader = csv.DictReader(f)
-            if len(csv_reader.fieldnames) != 2 or any(
-                    field not in csv_reader.fieldnames
-                    for field in ['name', 'measurement_unit']
-            ):
-                raise CommandError(
-                    'csv файл должен содержать две колонки: '
-                    '"name" и "measurement_unit"'
-                )
-            for row in csv_reader:
-                row = {
-                    key.lower(): value.lower() for key, value in row.items()
-                }
-                if Ingredient.objects.filter(**row).exists():
-                    skipped_ingredients += 1
-                    self.stdout.write(
-                        self.style.WARNING(
-                            f'Ингредиент {row} уже существует в базе данных.'
-                        )
-                    )
-                else:
-                    objects.append(Ingredient(**row))
-        Ingredient.objects.bulk_create(objects)
+            rows = (
+                Ingredient(**{
+                    field: str(row[field]).lower() for field in FIELDS
+                })
+                for row in READERS[file_format](f)
+            )
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                processed += len(batch)
+                self.stdout.write(f'Обработано строк: {processed}')
+        bump_version(Ingredient)
+        loaded = Ingredient.objects.count() - initial_count
         self.stdout.write(
             self.style.SUCCESS(
                 f'Импорт закончен.\n'
-                f'Загружено ингредиентов: {len(objects)}\n'
-                f'Пропущено ингредиентов: {skipped_ingredients}'
+                f'Загружено ингредиентов: {loaded}\n'
+                f'Пропущено ингредиентов: {processed - loaded}'
             )
         )
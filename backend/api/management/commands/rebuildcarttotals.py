@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingCartTotal
+from recipes.shopping_list import rebuild_cart_totals
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds or checks the denormalized shopping cart totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сравнить итоги с корзинами, не изменяя их.',
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            with transaction.atomic():
+                rebuild_cart_totals(User.objects.all())
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Итоги пересчитаны.\n'
+                    f'Записей: {ShoppingCartTotal.objects.count()}'
+                )
+            )
+            return
+        stored = set(
+            ShoppingCartTotal.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )
+        )
+        with transaction.atomic():
+            rebuild_cart_totals(User.objects.all())
+            expected = set(
+                ShoppingCartTotal.objects.values_list(
+                    'user_id', 'ingredient_id', 'amount'
+                )
+            )
+            transaction.set_rollback(True)
+        mismatched = stored ^ expected
+        if mismatched:
+            users = sorted({user_id for user_id, _, _ in mismatched})
+            raise CommandError(
+                f'Итоги расходятся с корзинами у пользователей: {users}'
+            )
+        self.stdout.write(self.style.SUCCESS('Итоги совпадают с корзинами.'))
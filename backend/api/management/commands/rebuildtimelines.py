@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.feed import rebuild_timelines
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the materialized following feeds'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = rebuild_timelines()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Ленты пересобраны.\nЗаписей: {created}'
+            )
+        )
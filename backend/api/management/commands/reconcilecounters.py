@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Reconciles denormalized recipe and user counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только найти расхождения, не исправляя их.',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            mismatches = reconcile_counters(fix=not options['check'])
+        for counter, count in mismatches.items():
+            style = self.style.WARNING if count else self.style.SUCCESS
+            self.stdout.write(style(f'{counter}: расхождений {count}'))
+        if options['check'] and any(mismatches.values()):
+            raise CommandError('Счётчики расходятся с данными.')
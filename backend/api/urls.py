@@ -1,10 +1,12 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from recipes.views import (FavoriteView, IngredientViewSet, RecipeViewSet,
-                           ShoppingCartView, TagViewSet,
+from recipes.views import (FavoriteBatchView, FavoriteView, FeedView,
+                           IngredientViewSet, RecipeViewSet,
+                           ShoppingCartBatchView, ShoppingCartView, TagViewSet,
                            download_shopping_cart)
-from users.views import FollowCreateDestroyView, FollowListView
+from users.views import (FollowBatchView, FollowCreateDestroyView,
+                         FollowListView)
 
 router = DefaultRouter()
 router.register('ingredients', IngredientViewSet)
@@ -17,12 +19,28 @@ urlpatterns = [
         download_shopping_cart,
         name='download_shopping_cart',
     ),
+    path('recipes/feed/', FeedView.as_view(), name='feed'),
+    path(
+        'recipes/favorite/',
+        FavoriteBatchView.as_view(),
+        name='favorite_batch',
+    ),
+    path(
+        'recipes/shopping_cart/',
+        ShoppingCartBatchView.as_view(),
+        name='shopping_cart_batch',
+    ),
     path('', include(router.urls)),
     path(
         'users/subscriptions/',
         FollowListView.as_view(),
         name='subscriptions',
     ),
+    path(
+        'users/subscribe/',
+        FollowBatchView.as_view(),
+        name='subscribe_batch',
+    ),
     path(
         'users/<int:user_id>/subscribe/',
         FollowCreateDestroyView.as_view(),
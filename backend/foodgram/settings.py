@@ -32,6 +32,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'recipes.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -82,6 +83,30 @@ DATABASES = DEVELOP_DATABASE if os.getenv(
     'DEVELOP_DATABASE_MODE', default='False'
 ) == 'True' else PRODUCTION_DATABASE
 
+# Версии моделей, журнал подбора по продуктам и кэш ответов должны быть
+# общими для всех процессов, поэтому в продакшене нужен общий кэш.
+PRODUCTION_CACHE = {
+    'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+    'LOCATION': 'memcached:11211',
+}
+DEVELOP_CACHE = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'foodgram',
+}
+DEFAULT_CACHE = (
+    DEVELOP_CACHE if DATABASES is DEVELOP_DATABASE else PRODUCTION_CACHE
+)
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', default=DEFAULT_CACHE['BACKEND']
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION', default=DEFAULT_CACHE['LOCATION']
+        ),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.'
@@ -129,6 +154,15 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'recipes.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'recipes.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'recipes.pagination.PageLimitPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_FILTER_BACKENDS': [
@@ -152,3 +186,11 @@ DJOSER = {
 }
 
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 3000
+
+MAX_IMAGE_SIZE = int(os.getenv('MAX_IMAGE_SIZE', default=5 * 1024 * 1024))
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+IMAGE_QUALITY = 80
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', default=10000))
+
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', default=1024))
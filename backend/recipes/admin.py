@@ -26,9 +26,9 @@ class RecipeForm(forms.ModelForm):
         initial = super().get_initial_for_field(field, field_name)
         if (
                 field_name == 'favorited_times'
-                and self.instance in Recipe.objects.all()
+                and self.instance.pk is not None
         ):
-            initial = self.instance.subscribers.count()
+            initial = self.instance.favorites_count
         return initial
 
 
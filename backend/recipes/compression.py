@@ -0,0 +1,119 @@
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+
+from recipes.constants import (BROTLI_QUALITY, COMPRESSIBLE_TYPES,
+                               GZIP_COMPRESSLEVEL)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def compress_gzip(content):
+    return gzip.compress(content, compresslevel=GZIP_COMPRESSLEVEL, mtime=0)
+
+
+def compress_brotli(content):
+    return brotli.compress(content, quality=BROTLI_QUALITY)
+
+
+def stream_brotli(chunks):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for chunk in chunks:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+COMPRESSORS = {'gzip': (compress_gzip, compress_sequence)}
+if brotli is not None:
+    COMPRESSORS = {'br': (compress_brotli, stream_brotli), **COMPRESSORS}
+
+
+def select_encoding(request):
+    """Лучшее из поддерживаемых сжатий, принимаемых клиентом."""
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        encoding, _, params = item.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0
+        if quality > 0:
+            accepted.add(encoding.strip().lower())
+    for encoding in COMPRESSORS:
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+def compress(content, encoding):
+    """Сжатое содержимое или None, если сжимать его невыгодно."""
+    if len(content) < settings.COMPRESSION_MIN_SIZE:
+        return None
+    compressed = COMPRESSORS[encoding][0](content)
+    if len(compressed) >= len(content):
+        return None
+    return compressed
+
+
+def is_compressible(response):
+    """Сжимаются только ответы API и списки покупок. HTML-страницы
+    админки и browsable API несут CSRF-токен, и их сжатие открыло бы
+    атаку BREACH."""
+    return not response.has_header('Content-Encoding') and response.get(
+        'Content-Type', ''
+    ).startswith(COMPRESSIBLE_TYPES)
+
+
+def set_content_encoding(response, encoding):
+    """Заголовки сжатого ответа; ETag становится слабым, как в
+    GZipMiddleware."""
+    response['Content-Encoding'] = encoding
+    if not response.streaming:
+        response['Content-Length'] = str(len(response.content))
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+    patch_vary_headers(response, ('Accept-Encoding',))
+
+
+class CompressionMiddleware:
+    """Сжимает ответы brotli, если он установлен, или gzip.
+
+    Ответы короче COMPRESSION_MIN_SIZE отдаются как есть. Уже сжатые
+    ответы (например, из кэша ответов) не трогаются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not is_compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = select_encoding(request)
+        if encoding is None:
+            return response
+        if response.streaming:
+            response.streaming_content = COMPRESSORS[encoding][1](
+                response.streaming_content
+            )
+            if response.has_header('Content-Length'):
+                del response['Content-Length']
+        else:
+            compressed = compress(response.content, encoding)
+            if compressed is None:
+                return response
+            response.content = compressed
+        set_content_encoding(response, encoding)
+        return response
@@ -1,3 +1,21 @@
 LONG_FIELD_MAX_LENGTH: int = 200
 SHORT_FIELD_MAX_LENGTH: int = 50
-SHOPPING_CART_FILENAME: int = 'shopping_list.txt'
+SHOPPING_CART_FILENAME: str = 'shopping_list'
+BATCH_MAX_SIZE: int = 500
+BASE64_CHUNK_SIZE: int = 64 * 1024
+IMAGE_SIGNATURES: tuple = (
+    b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff', b'GIF87a', b'GIF89a', b'BM',
+)
+IMAGE_VARIANTS: dict = {
+    'thumbnail': ((480, 320), 'JPEG'),
+    'thumbnail_webp': ((480, 320), 'WEBP'),
+    'webp': (None, 'WEBP'),
+}
+SIMILAR_RECIPES_LIMIT: int = 10
+SIMILAR_TAG_WEIGHT: float = 0.5
+SIMILAR_MAX_POSTINGS: int = 5000
+PANTRY_JOURNAL_SIZE: int = 1000
+PANTRY_JOURNAL_TIMEOUT: int = 24 * 60 * 60
+GZIP_COMPRESSLEVEL: int = 6
+BROTLI_QUALITY: int = 5
+COMPRESSIBLE_TYPES: tuple = ('application/json', 'text/csv', 'text/plain')
@@ -0,0 +1,85 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.feed import update_fanout
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+def change_counter(queryset, field, delta):
+    queryset.update(**{field: F(field) + delta})
+
+
+def update_m2m_counter(
+        counted_model, field, source, target,
+        sender, instance, action, reverse, pk_set, **kwargs
+):
+    """Обновляет счётчик на целевой стороне m2m-связи по m2m_changed."""
+    if action in ('post_add', 'post_remove'):
+        delta = 1 if action == 'post_add' else -1
+        if reverse:
+            change_counter(
+                counted_model.objects.filter(pk=instance.pk),
+                field, delta * len(pk_set),
+            )
+        else:
+            change_counter(
+                counted_model.objects.filter(pk__in=pk_set), field, delta
+            )
+    elif action == 'pre_clear':
+        if reverse:
+            counted_model.objects.filter(pk=instance.pk).update(**{field: 0})
+        else:
+            change_counter(
+                counted_model.objects.filter(
+                    pk__in=sender.objects.filter(
+                        **{source: instance.pk}
+                    ).values(target)
+                ),
+                field, -1,
+            )
+
+
+def _count(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).values(field).annotate(
+                total=Count('*')
+            ).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def get_counters():
+    """Счётчики в виде (модель, поле, выражение для пересчёта)."""
+    return (
+        (Recipe, 'favorites_count',
+         _count(User.favorites.through.objects, 'recipe_id')),
+        (Recipe, 'shopping_cart_count',
+         _count(User.shopping_cart.through.objects, 'recipe_id')),
+        (User, 'recipes_count', _count(Recipe.objects, 'author_id')),
+        (User, 'followers_count',
+         _count(User.followings.through.objects, 'to_usermodel_id')),
+    )
+
+
+def reconcile_counters(fix=True):
+    """Сверяет счётчики с данными, возвращает число расхождений по полям."""
+    mismatches = {}
+    for model, field, expression in get_counters():
+        wrong = model.objects.annotate(actual=expression).exclude(
+            **{field: F('actual')}
+        )
+        ids = list(wrong.values_list('pk', flat=True))
+        mismatches[f'{model._meta.label}.{field}'] = len(ids)
+        if fix and ids:
+            model.objects.filter(pk__in=ids).update(
+                **{field: expression}
+            )
+            if field == 'followers_count':
+                update_fanout(ids)
+    return mismatches
@@ -0,0 +1,137 @@
+import heapq
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Q
+
+from recipes.models import Recipe, TimelineEntry
+
+User = get_user_model()
+
+
+def fill_timelines(user_ids=None, author_ids=None, recipe_ids=None):
+    """Раскладывает рецепты по лентам подписчиков одним INSERT ... SELECT.
+
+    Пропускает авторов со снятым feed_fanout: их рецепты подмешиваются
+    в ленту при чтении. Возвращает число добавленных записей.
+    """
+    quote_name = connection.ops.quote_name
+    followings = User.followings.through._meta.db_table
+    conditions = ['author.feed_fanout = %s']
+    params = [True]
+    for column, ids in (
+            ('follow.from_usermodel_id', user_ids),
+            ('follow.to_usermodel_id', author_ids),
+            ('recipe.id', recipe_ids),
+    ):
+        if ids is not None:
+            ids = list(ids)
+            if not ids:
+                return 0
+            conditions.append(
+                f'{column} IN ({", ".join(["%s"] * len(ids))})'
+            )
+            params.extend(ids)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote_name(TimelineEntry._meta.db_table)} '
+            f'(user_id, recipe_id, author_id, pub_date) '
+            f'SELECT follow.from_usermodel_id, recipe.id, recipe.author_id, '
+            f'recipe.pub_date '
+            f'FROM {quote_name(followings)} follow '
+            f'JOIN {quote_name(Recipe._meta.db_table)} recipe '
+            f'ON recipe.author_id = follow.to_usermodel_id '
+            f'JOIN {quote_name(User._meta.db_table)} author '
+            f'ON author.id = follow.to_usermodel_id '
+            f'WHERE {" AND ".join(conditions)} '
+            f'ON CONFLICT DO NOTHING',
+            params,
+        )
+        return cursor.rowcount
+
+
+def trim_timelines(user_ids, author_ids):
+    """Убирает из лент рецепты авторов, от которых отписались."""
+    TimelineEntry.objects.filter(
+        user_id__in=user_ids, author_id__in=author_ids
+    ).delete()
+
+
+def update_fanout(author_ids):
+    """Переключает feed_fanout авторов, чьё число подписчиков пересекло
+    FEED_FANOUT_LIMIT.
+
+    Авторам, вернувшимся под лимит, ленты подписчиков дозаполняются:
+    рецепты, опубликованные без раскладки, иначе пропали бы из лент.
+    """
+    authors = User.objects.filter(pk__in=author_ids)
+    authors.filter(
+        feed_fanout=True, followers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).update(feed_fanout=False)
+    returned = list(
+        authors.filter(
+            feed_fanout=False,
+            followers_count__lte=settings.FEED_FANOUT_LIMIT,
+        ).values_list('pk', flat=True)
+    )
+    if returned:
+        User.objects.filter(pk__in=returned).update(feed_fanout=True)
+        fill_timelines(author_ids=returned)
+
+
+def rebuild_timelines():
+    """Пересобирает ленты всех пользователей с нуля."""
+    TimelineEntry.objects.all().delete()
+    User.objects.filter(
+        followers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).update(feed_fanout=False)
+    User.objects.filter(
+        followers_count__lte=settings.FEED_FANOUT_LIMIT
+    ).update(feed_fanout=True)
+    return fill_timelines()
+
+
+def after_position(queryset, date_field, id_field, position):
+    if position is None:
+        return queryset
+    pub_date, recipe_id = position
+    return queryset.filter(
+        Q(**{f'{date_field}__lt': pub_date})
+        | Q(**{date_field: pub_date, f'{id_field}__lt': recipe_id})
+    )
+
+
+def get_feed_positions(user, position=None, limit=10):
+    """Позиции (pub_date, recipe_id) ленты пользователя после position.
+
+    Материализованная лента сливается с рецептами авторов, для которых
+    раскладка при записи не выполняется.
+    """
+    timeline = after_position(
+        TimelineEntry.objects.filter(user=user),
+        'pub_date', 'recipe_id', position,
+    ).order_by('-pub_date', '-recipe_id').values_list(
+        'pub_date', 'recipe_id'
+    )[:limit]
+    popular_author_ids = list(
+        User.followings.through.objects.filter(
+            from_usermodel_id=user.id, to_usermodel__feed_fanout=False,
+        ).values_list('to_usermodel_id', flat=True)
+    )
+    popular = []
+    if popular_author_ids:
+        popular = after_position(
+            Recipe.objects.filter(author_id__in=popular_author_ids),
+            'pub_date', 'id', position,
+        ).order_by('-pub_date', '-id').values_list('pub_date', 'id')[:limit]
+    positions, seen = [], set()
+    for pub_date, recipe_id in heapq.merge(
+            timeline, popular, reverse=True
+    ):
+        if recipe_id not in seen:
+            seen.add(recipe_id)
+            positions.append((pub_date, recipe_id))
+            if len(positions) == limit:
+                break
+    return positions
@@ -1,10 +1,34 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
 from django.forms import MultipleChoiceField
 from django.forms.fields import CharField
 from django_filters import Filter
 from django_filters import rest_framework as filters
 from django_filters.constants import EMPTY_VALUES
 
-from recipes.models import Recipe
+from recipes.models import Recipe, Tag
+from recipes.search import search_recipes
+from recipes.versions import get_version
+
+User = get_user_model()
+
+_tag_ids_lock = threading.Lock()
+_tag_ids = {}
+_tag_ids_version = None
+
+
+def get_tag_ids(slugs):
+    """ID тегов по slug из кэша, перестраиваемого при смене версии Tag."""
+    global _tag_ids, _tag_ids_version
+    version = get_version(Tag)
+    if _tag_ids_version != version:
+        with _tag_ids_lock:
+            if _tag_ids_version != version:
+                _tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+                _tag_ids_version = version
+    return [_tag_ids[slug] for slug in slugs if slug in _tag_ids]
 
 
 class MultipleValueField(MultipleChoiceField):
@@ -38,23 +62,50 @@ class MultipleValueFilter(Filter):
 
 class RecipeFilter(filters.FilterSet):
     author = filters.NumberFilter(field_name='author')
-    tags = MultipleValueFilter(field_name='tags__slug', field_class=CharField)
+    tags = MultipleValueFilter(
+        field_name='tags__slug', field_class=CharField, method='filter_tags'
+    )
     is_in_shopping_cart = filters.NumberFilter(
         method='filter_is_in_shopping_cart'
     )
     is_favorited = filters.NumberFilter(
         method='filter_is_favorited'
     )
+    search = filters.CharFilter(method='filter_search')
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_tags(self, queryset, name, value):
+        return queryset.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe_id=OuterRef('pk'), tag_id__in=get_tag_ids(value)
+                )
+            )
+        )
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if not self.request.auth or value != 1:
             return queryset
-        return queryset & self.request.user.shopping_cart.all()
+        return queryset.filter(
+            Exists(
+                User.shopping_cart.through.objects.filter(
+                    recipe_id=OuterRef('pk'), usermodel_id=self.request.user.id
+                )
+            )
+        )
 
     def filter_is_favorited(self, queryset, name, value):
         if not self.request.auth or value != 1:
             return queryset
-        return queryset & self.request.user.favorites.all()
+        return queryset.filter(
+            Exists(
+                User.favorites.through.objects.filter(
+                    recipe_id=OuterRef('pk'), usermodel_id=self.request.user.id
+                )
+            )
+        )
 
     class Meta:
         model = Recipe
@@ -0,0 +1,147 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from recipes.constants import IMAGE_VARIANTS
+from recipes.storage import lock_name
+from recipes.versions import bump_version
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            thread_name_prefix='recipe-images',
+        )
+    return _executor
+
+
+def variants_ready(recipe):
+    variants = recipe.image_variants or {}
+    return bool(recipe.image) and variants.get('source') == recipe.image.name
+
+
+def variant_names(name, variants):
+    """Файлы версий изображения; пока версии не готовы — исходный файл."""
+    if (variants or {}).get('source') == name:
+        return {variant: variants[variant] for variant in IMAGE_VARIANTS}
+    return dict.fromkeys(IMAGE_VARIANTS, name)
+
+
+def render_variant(image, size, image_format):
+    if size is not None:
+        image = ImageOps.fit(image, size, Image.LANCZOS)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=settings.IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def get_storage():
+    from recipes.models import Recipe
+
+    return Recipe._meta.get_field('image').storage
+
+
+@transaction.atomic
+def release_image(name, variants):
+    """Удаляет изображение и его версии, если на них не ссылается
+    ни один рецепт.
+
+    Версии удаляются, только если построены из этого изображения, и
+    только те, что не используются другими рецептами. Проверка ссылок и
+    удаление идут под блокировкой имени, которую держит и
+    незакоммиченная загрузка того же файла.
+    """
+    from recipes.models import Recipe
+
+    if not name:
+        return
+    lock_name(name)
+    if Recipe.objects.filter(image=name).exists():
+        return
+    storage = get_storage()
+    storage.delete(name)
+    if (variants or {}).get('source') != name:
+        return
+    condition = Q()
+    for variant in IMAGE_VARIANTS:
+        lock_name(variants[variant])
+        condition |= Q(**{f'image_variants__{variant}': variants[variant]})
+    used = set()
+    for other in Recipe.objects.filter(condition).values_list(
+            'image_variants', flat=True
+    ):
+        used.update(other.values())
+    for variant in IMAGE_VARIANTS:
+        if variants[variant] not in used:
+            storage.delete(variants[variant])
+
+
+def generate_variants(recipe_id, source):
+    """Строит миниатюры и WebP-версии изображения рецепта."""
+    from recipes.models import Recipe
+
+    close_old_connections()
+    try:
+        recipe = Recipe.objects.filter(id=recipe_id).only(
+            'image', 'image_variants'
+        ).first()
+        if recipe is None or recipe.image.name != source:
+            return
+        storage = get_storage()
+        with storage.open(source) as file:
+            image = Image.open(file)
+            image.load()
+        image = ImageOps.exif_transpose(image)
+        variants = {'source': source}
+        with transaction.atomic():
+            for variant, (size, image_format) in IMAGE_VARIANTS.items():
+                variants[variant] = storage.save(
+                    f'{variant}.{image_format.lower()}',
+                    ContentFile(render_variant(image, size, image_format)),
+                )
+            updated = Recipe.objects.filter(
+                id=recipe_id, image=source
+            ).update(image_variants=variants)
+        if updated:
+            bump_version(Recipe)
+        else:
+            release_image(source, variants)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', source)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(recipe):
+    """Ставит обработку изображения в очередь после коммита транзакции."""
+    from recipes.models import Recipe
+
+    if not recipe.image or variants_ready(recipe):
+        return
+    recipe_id, source = recipe.id, recipe.image.name
+    ready_variants = Recipe.objects.filter(
+        image=source, image_variants__source=source
+    ).values_list('image_variants', flat=True).first()
+    if ready_variants is not None:
+        Recipe.objects.filter(id=recipe_id).update(
+            image_variants=ready_variants
+        )
+        recipe.image_variants = ready_variants
+        return
+    transaction.on_commit(
+        lambda: get_executor().submit(generate_variants, recipe_id, source)
+    )
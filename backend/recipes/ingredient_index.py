@@ -0,0 +1,68 @@
+import threading
+from bisect import bisect_left
+
+from recipes.models import Ingredient
+from recipes.versions import get_version
+
+
+class IngredientIndex:
+    """Отсортированный по названию в нижнем регистре массив ингредиентов.
+
+    Совпадения по префиксу ищутся бинарным поиском, совпадения по
+    подстроке — линейным проходом, только если префиксных не хватило.
+    """
+
+    def __init__(self, ingredients):
+        rows = sorted(
+            (
+                (name.lower(), {
+                    'measurement_unit': measurement_unit,
+                    'id': ingredient_id,
+                    'name': name,
+                })
+                for ingredient_id, name, measurement_unit in ingredients
+            ),
+            key=lambda row: (row[0], row[1]['id']),
+        )
+        self.keys = [key for key, _ in rows]
+        self.items = [item for _, item in rows]
+
+    def search(self, query, limit=None):
+        query = query.lower()
+        start = bisect_left(self.keys, query)
+        stop = bisect_left(self.keys, query + '\uffff', lo=start)
+        if limit is not None:
+            stop = min(stop, start + limit)
+        result = self.items[start:stop]
+        if limit is not None and len(result) >= limit:
+            return result
+        for position, key in enumerate(self.keys):
+            if query in key and not key.startswith(query):
+                result.append(self.items[position])
+                if len(result) == limit:
+                    break
+        return result
+
+    def all(self):
+        return self.items
+
+
+_lock = threading.Lock()
+_index = None
+_index_version = None
+
+
+def get_ingredient_index():
+    """Лениво строит индекс и перестраивает его при смене версии."""
+    global _index, _index_version
+    version = get_version(Ingredient)
+    if _index is None or _index_version != version:
+        with _lock:
+            if _index is None or _index_version != version:
+                _index = IngredientIndex(
+                    Ingredient.objects.values_list(
+                        'id', 'name', 'measurement_unit'
+                    ).iterator()
+                )
+                _index_version = version
+    return _index
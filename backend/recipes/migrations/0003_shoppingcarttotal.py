@@ -0,0 +1,58 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_shopping_cart_totals(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingCartTotal = apps.get_model('recipes', 'ShoppingCartTotal')
+    ShoppingCartTotal.objects.bulk_create(
+        ShoppingCartTotal(
+            user_id=row['recipe__cooking_chef'],
+            ingredient_id=row['ingredient_id'],
+            amount=row['total_amount'],
+        )
+        for row in RecipeIngredient.objects.filter(
+            recipe__cooking_chef__isnull=False
+        ).values('recipe__cooking_chef', 'ingredient_id').annotate(
+            total_amount=Sum('amount')
+        ).order_by()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='recipeingredient',
+            options={'verbose_name': 'Ингредиент к рецепту', 'verbose_name_plural': 'Ингредиенты к рецепту'},
+        ),
+        migrations.CreateModel(
+            name='ShoppingCartTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_totals', to='recipes.ingredient')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_totals', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Итог списка покупок',
+                'verbose_name_plural': 'Итоги списков покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcarttotal',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique ingredient totals for user'),
+        ),
+        migrations.RunPython(
+            fill_shopping_cart_totals, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_shoppingcarttotal'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', 'id'], name='recipe_pub_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:12
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).values(field).annotate(
+                total=Count('*')
+            ).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    UserModel = apps.get_model('users', 'UserModel')
+    Recipe.objects.update(
+        favorites_count=count_subquery(
+            UserModel.favorites.through.objects, 'recipe_id'
+        ),
+        shopping_cart_count=count_subquery(
+            UserModel.shopping_cart.through.objects, 'recipe_id'
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_pub_date_id_idx'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Добавлений в список покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
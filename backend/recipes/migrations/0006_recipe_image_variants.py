@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(default=dict, editable=False, verbose_name='Версии изображения'),
+        ),
+    ]
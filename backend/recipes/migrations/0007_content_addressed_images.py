@@ -0,0 +1,20 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(storage=recipes.storage.ContentAddressedStorage(), upload_to='', verbose_name='Изображение'),
+        ),
+    ]
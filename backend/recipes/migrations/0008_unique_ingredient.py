@@ -0,0 +1,76 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:16
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min, OuterRef, Subquery, Sum
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingCartTotal = apps.get_model('recipes', 'ShoppingCartTotal')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep_id=Min('id'), total=Count('id')).filter(total__gt=1)
+    if not duplicates.exists():
+        return
+    for group in duplicates:
+        keep_id = group['keep_id']
+        extra = Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(id=keep_id)
+        for ingredient_id in extra.values_list('id', flat=True):
+            duplicate = RecipeIngredient.objects.filter(
+                ingredient_id=ingredient_id
+            )
+            RecipeIngredient.objects.filter(
+                ingredient_id=keep_id,
+                recipe_id__in=duplicate.values('recipe_id'),
+            ).update(
+                amount=F('amount') + Subquery(
+                    duplicate.filter(
+                        recipe_id=OuterRef('recipe_id')
+                    ).values('amount')
+                )
+            )
+            RecipeIngredient.objects.filter(
+                ingredient_id=ingredient_id
+            ).exclude(
+                recipe_id__in=RecipeIngredient.objects.filter(
+                    ingredient_id=keep_id
+                ).values('recipe_id')
+            ).update(ingredient_id=keep_id)
+        extra.delete()
+    ShoppingCartTotal.objects.all().delete()
+    ShoppingCartTotal.objects.bulk_create(
+        ShoppingCartTotal(
+            user_id=row['recipe__cooking_chef'],
+            ingredient_id=row['ingredient_id'],
+            amount=row['total_amount'],
+        )
+        for row in RecipeIngredient.objects.filter(
+            recipe__cooking_chef__isnull=False
+        ).values('recipe__cooking_chef', 'ingredient_id').annotate(
+            total_amount=Sum('amount')
+        ).order_by()
+    )
+    if schema_editor.connection.vendor == 'postgresql':
+        # Иначе отложенные проверки внешних ключей не дадут AddConstraint
+        # изменить таблицу в той же транзакции.
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique ingredient name and unit'),
+        ),
+    ]
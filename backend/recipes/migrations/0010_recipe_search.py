@@ -0,0 +1,101 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+POSTGRESQL_FORWARD = (
+    """
+    CREATE FUNCTION recipes_recipe_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('pg_catalog.russian',
+                                  coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('pg_catalog.russian',
+                                  coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_vector_update();
+    """,
+    'UPDATE recipes_recipe SET name = name;',
+    'CREATE INDEX recipes_recipe_search_vector_idx '
+    'ON recipes_recipe USING gin (search_vector);',
+)
+POSTGRESQL_BACKWARD = (
+    'DROP INDEX recipes_recipe_search_vector_idx;',
+    'DROP TRIGGER recipes_recipe_search_vector_trigger ON recipes_recipe;',
+    'DROP FUNCTION recipes_recipe_search_vector_update();',
+)
+SQLITE_FORWARD = (
+    """
+    CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5(
+        name, text, content='recipes_recipe', content_rowid='id',
+        tokenize='unicode61'
+    );
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_fts_insert AFTER INSERT ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END;
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_fts_delete AFTER DELETE ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END;
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_fts_update
+    AFTER UPDATE OF name, text ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO recipes_recipe_fts(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END;
+    """,
+    "INSERT INTO recipes_recipe_fts(recipes_recipe_fts) VALUES ('rebuild');",
+)
+SQLITE_BACKWARD = (
+    'DROP TRIGGER recipes_recipe_fts_update;',
+    'DROP TRIGGER recipes_recipe_fts_delete;',
+    'DROP TRIGGER recipes_recipe_fts_insert;',
+    'DROP TABLE recipes_recipe_fts;',
+)
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_tags_tag_recipe_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            run_for_vendor({
+                'postgresql': POSTGRESQL_FORWARD,
+                'sqlite': SQLITE_FORWARD,
+            }),
+            run_for_vendor({
+                'postgresql': POSTGRESQL_BACKWARD,
+                'sqlite': SQLITE_BACKWARD,
+            }),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_timelines(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    TimelineEntry = apps.get_model('recipes', 'TimelineEntry')
+    Follow = apps.get_model(
+        *settings.AUTH_USER_MODEL.split('.')
+    ).followings.through
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id, recipe_id=recipe_id,
+                author_id=author_id, pub_date=pub_date,
+            )
+            for user_id, author_id in Follow.objects.filter(
+                to_usermodel__followers_count__lte=settings.FEED_FANOUT_LIMIT
+            ).values_list('from_usermodel_id', 'to_usermodel_id').iterator()
+            for recipe_id, pub_date in Recipe.objects.filter(
+                author_id=author_id
+            ).values_list('id', 'pub_date')
+        ),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0010_recipe_search'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Добавлено')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='recipes.recipe')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='timeline_user_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique recipe in user timeline'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,117 @@
+import hashlib
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag, urlencode
+
+from recipes.compression import (compress, is_compressible, select_encoding,
+                                 set_content_encoding)
+from recipes.versions import get_versions
+
+RESPONSE_CACHE_KEY = 'response:{version}:{request}:{encoding}'
+
+
+class VersionedResponseCacheMixin:
+    """Кэширует отрендеренные GET-ответы по версиям моделей.
+
+    Ключ кэша и ETag строятся из хэша версий всех cache_models, а
+    Last-Modified — из самой поздней из них. Повторный запрос получает
+    304 или готовые байты из кэша, не доходя до БД и сериализатора.
+    Рядом с исходными байтами хранятся сжатые, чтобы не сжимать один и
+    тот же ответ на каждый запрос.
+    """
+
+    cache_models = ()
+
+    def get_cache_version(self, versions):
+        """Хэш всех версий: максимум не сменился бы при изменении из
+        процесса с отстающими часами."""
+        return hashlib.sha256(
+            ':'.join(map(str, versions)).encode()
+        ).hexdigest()[:32]
+
+    def get_cache_request(self, request):
+        """Хэш абсолютного URL с отсортированными параметрами и заголовка
+        Accept.
+
+        Схема и хост входят в ключ: ответы содержат абсолютные ссылки на
+        страницы и изображения. Хэш укладывается в ограничения memcached
+        на длину и символы ключа.
+        """
+        query = sorted(
+            (key, value)
+            for key, values in request.GET.lists() for value in values
+        )
+        url = request.build_absolute_uri(f'{request.path}?{urlencode(query)}')
+        accept = request.META.get('HTTP_ACCEPT', '')
+        return hashlib.sha256(f'{url}\n{accept}'.encode()).hexdigest()[:32]
+
+    def is_response_cacheable(self, request):
+        return request.method == 'GET'
+
+    def is_content_cacheable(self, request, response):
+        """Кэшируется только JSON: HTML browsable API содержит CSRF-токен
+        посетителя, который нельзя отдавать другим."""
+        return (
+            not request.META.get('CSRF_COOKIE_USED')
+            and response['Content-Type'].startswith('application/json')
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.is_response_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+        versions = get_versions(self.cache_models)
+        version = self.get_cache_version(versions)
+        etag = quote_etag(version)
+        last_modified = max(versions) // 10 ** 9
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = self._get_cached_response(
+                request, version, *args, **kwargs
+            )
+        if response.status_code in (200, 304):
+            if response.has_header('Content-Encoding'):
+                etag = 'W/' + etag
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+        return response
+
+    def get_cache_key(self, request, version, encoding):
+        return RESPONSE_CACHE_KEY.format(
+            version=version,
+            request=self.get_cache_request(request),
+            encoding=encoding,
+        )
+
+    def _get_cached_response(self, request, version, *args, **kwargs):
+        encoding = select_encoding(request)
+        key = self.get_cache_key(request, version, 'identity')
+        encoded_key = self.get_cache_key(request, version, encoding)
+        cached = cache.get_many((key, encoded_key) if encoding else (key,))
+        if encoding and encoded_key in cached:
+            content, content_type = cached[encoded_key]
+            response = HttpResponse(content, content_type=content_type)
+            set_content_encoding(response, encoding)
+            return response
+        if key in cached:
+            content, content_type = cached[key]
+            response = HttpResponse(content, content_type=content_type)
+        else:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            response.render()
+            if not self.is_content_cacheable(request, response):
+                return response
+            cache.set(key, (response.content, response['Content-Type']))
+        if encoding and is_compressible(response):
+            compressed = compress(response.content, encoding)
+            if compressed is not None:
+                cache.set(encoded_key, (compressed, response['Content-Type']))
+                response.content = compressed
+                set_content_encoding(response, encoding)
+        return response
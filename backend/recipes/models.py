@@ -1,7 +1,11 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Exists, F, OuterRef, Prefetch, Window
+from django.db.models.functions import RowNumber
 
 from recipes.constants import LONG_FIELD_MAX_LENGTH, SHORT_FIELD_MAX_LENGTH
+from recipes.storage import ContentAddressedStorage
 from recipes.validators import validate_positive
 
 User = get_user_model()
@@ -40,11 +44,92 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ('name',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique ingredient name and unit'
+            )
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_user_flags(self, user):
+        """Аннотирует рецепты флагами избранного и списка покупок."""
+        if not user.is_authenticated:
+            return self
+        return self.annotate(
+            is_favorited=Exists(
+                User.favorites.through.objects.filter(
+                    usermodel_id=user.id, recipe_id=OuterRef('pk')
+                )
+            ),
+            is_in_shopping_cart=Exists(
+                User.shopping_cart.through.objects.filter(
+                    usermodel_id=user.id, recipe_id=OuterRef('pk')
+                )
+            ),
+        )
+
+    def for_read(self, user):
+        """Queryset для чтения рецептов без N+1 запросов."""
+        authors = User.objects.all()
+        if user.is_authenticated:
+            authors = authors.annotate(
+                is_subscribed=Exists(
+                    User.followings.through.objects.filter(
+                        from_usermodel_id=user.id,
+                        to_usermodel_id=OuterRef('pk'),
+                    )
+                )
+            )
+        return self.with_user_flags(user).defer(
+            'search_vector'
+        ).prefetch_related(
+            Prefetch('author', queryset=authors),
+            'tags',
+            Prefetch(
+                'ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                ).order_by('id'),
+            ),
+        )
+
+    def latest_by_authors(self, author_ids, limit=None):
+        """Последние limit рецептов каждого автора одним запросом.
+
+        Возвращает словарь {author_id: [рецепты]}, рецепты отсортированы
+        от новых к старым.
+        """
+        if not author_ids:
+            return {}
+        ranked = self.filter(author_id__in=author_ids).annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=[F('pub_date').desc(), F('id').desc()],
+            )
+        ).order_by()
+        sql, params = ranked.query.sql_with_params()
+        condition = ''
+        if limit is not None:
+            condition = 'WHERE ranked.row_number <= %s'
+            params = (*params, limit)
+        recipes = self.model.objects.raw(
+            f'SELECT * FROM ({sql}) ranked {condition} '
+            f'ORDER BY ranked.author_id, ranked.row_number',
+            params,
+        )
+        result = {author_id: [] for author_id in author_ids}
+        for recipe in recipes:
+            result[recipe.author_id].append(recipe)
+        return result
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User, on_delete=models.CASCADE, verbose_name='Автор'
@@ -52,7 +137,12 @@ class Recipe(models.Model):
     name = models.CharField(
         max_length=LONG_FIELD_MAX_LENGTH, verbose_name='Название'
     )
-    image = models.ImageField(verbose_name='Изображение')
+    image = models.ImageField(
+        storage=ContentAddressedStorage(), verbose_name='Изображение'
+    )
+    image_variants = models.JSONField(
+        default=dict, editable=False, verbose_name='Версии изображения'
+    )
     text = models.TextField(verbose_name='Описание')
     pub_date = models.DateTimeField(
         auto_now_add=True,
@@ -62,12 +152,26 @@ class Recipe(models.Model):
         verbose_name='Время приготовления', validators=(validate_positive,)
     )
     tags = models.ManyToManyField(Tag, verbose_name='Теги')
+    favorites_count = models.IntegerField(
+        default=0, editable=False, verbose_name='Добавлений в избранное'
+    )
+    shopping_cart_count = models.IntegerField(
+        default=0, editable=False, verbose_name='Добавлений в список покупок'
+    )
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         default_related_name = 'recipes'
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['-pub_date', 'id'], name='recipe_pub_date_id_idx'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -96,3 +200,90 @@ class RecipeIngredient(models.Model):
 
     def __str__(self):
         return f'{self.recipe} - {self.ingredient}'
+
+
+class ShoppingCartTotal(models.Model):
+    user = models.ForeignKey(
+        User, related_name='shopping_cart_totals', on_delete=models.CASCADE
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, related_name='shopping_cart_totals',
+        on_delete=models.CASCADE
+    )
+    amount = models.IntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique ingredient totals for user'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient}'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User, related_name='timeline', on_delete=models.CASCADE
+    )
+    recipe = models.ForeignKey(
+        Recipe, related_name='timeline_entries', on_delete=models.CASCADE
+    )
+    author = models.ForeignKey(
+        User, related_name='+', on_delete=models.CASCADE
+    )
+    pub_date = models.DateTimeField(verbose_name='Добавлено')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique recipe in user timeline'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='timeline_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'], name='timeline_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.recipe}'
+
+
+class SimilarRecipe(models.Model):
+    recipe = models.ForeignKey(
+        Recipe, related_name='similar_entries', on_delete=models.CASCADE
+    )
+    similar = models.ForeignKey(
+        Recipe, related_name='+', on_delete=models.CASCADE
+    )
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique similar recipe'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'], name='similar_recipe_score_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} - {self.similar}'
@@ -1,5 +1,131 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import (BasePagination, CursorPagination,
+                                       PageNumberPagination)
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from recipes.feed import get_feed_positions
 
 
 class PageLimitPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class RecipeCursorPagination(CursorPagination):
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', 'id')
+
+
+class RecipePagination(PageLimitPagination):
+    """Постраничная пагинация с курсорным режимом по запросу.
+
+    Клиент включает курсорный режим параметром ?cursor= (пустой для
+    первой страницы), дальше переходит по ссылкам next/previous.
+    Курсорный режим не считает COUNT(*) и не использует OFFSET.
+    Курсор сортирует по (-pub_date, id), поэтому с собственной
+    сортировкой запроса, например по релевантности поиска, он
+    недоступен.
+    """
+
+    cursor_pagination_class = RecipeCursorPagination
+    cursor_ordering_message = (
+        'Курсорный режим недоступен для запросов со своей сортировкой, '
+        'например для поиска.'
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        cursor_query_param = self.cursor_pagination_class.cursor_query_param
+        if cursor_query_param in request.query_params:
+            if queryset.query.order_by:
+                raise ValidationError(
+                    {cursor_query_param: self.cursor_ordering_message}
+                )
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class FeedPagination(BasePagination):
+    """Курсорная пагинация ленты подписок по ключу (pub_date, id)."""
+
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            pub_date, recipe_id = urlsafe_b64decode(
+                encoded.encode('ascii')
+            ).decode('ascii').split('|')
+            pub_date, recipe_id = parse_datetime(pub_date), int(recipe_id)
+        except (BinasciiError, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return pub_date, recipe_id
+
+    @staticmethod
+    def encode_cursor(position):
+        pub_date, recipe_id = position
+        return urlsafe_b64encode(
+            f'{pub_date.isoformat()}|{recipe_id}'.encode('ascii')
+        ).decode('ascii')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        positions = get_feed_positions(
+            request.user, self.decode_cursor(request), page_size + 1
+        )
+        self.next_position = None
+        if len(positions) > page_size:
+            positions = positions[:page_size]
+            self.next_position = positions[-1]
+        recipes = queryset.in_bulk(
+            [recipe_id for _, recipe_id in positions]
+        )
+        return [
+            recipes[recipe_id] for _, recipe_id in positions
+            if recipe_id in recipes
+        ]
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            self.encode_cursor(self.next_position),
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
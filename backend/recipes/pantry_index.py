@@ -0,0 +1,187 @@
+import threading
+from array import array
+from collections import Counter
+
+from django.core.cache import cache
+
+from recipes.constants import PANTRY_JOURNAL_SIZE, PANTRY_JOURNAL_TIMEOUT
+from recipes.models import Recipe, RecipeIngredient
+
+SEQUENCE_KEY = 'pantry-changes'
+CHANGE_KEY = 'pantry-change:{}'
+
+
+class PantryIndex:
+    """Инвертированный индекс ингредиент → рецепты для подбора по
+    продуктам в наличии.
+
+    Списки рецептов хранятся в компактных массивах array('I'). Готовый
+    индекс не изменяется: update строит обновлённую копию, поэтому
+    параллельные чтения не видят частично обновлённых данных.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.ingredients = {}
+        self.cooking_times = {}
+        self.tags = {}
+
+    def load(self, recipe_ids=None):
+        recipes = Recipe.objects.all()
+        recipe_ingredients = RecipeIngredient.objects.all()
+        recipe_tags = Recipe.tags.through.objects.all()
+        if recipe_ids is not None:
+            recipes = recipes.filter(id__in=recipe_ids)
+            recipe_ingredients = recipe_ingredients.filter(
+                recipe_id__in=recipe_ids
+            )
+            recipe_tags = recipe_tags.filter(recipe_id__in=recipe_ids)
+        ingredients = {}
+        for recipe_id, ingredient_id in recipe_ingredients.values_list(
+                'recipe_id', 'ingredient_id'
+        ).iterator():
+            ingredients.setdefault(recipe_id, array('I')).append(
+                ingredient_id
+            )
+        tags = {}
+        for recipe_id, tag_id in recipe_tags.values_list(
+                'recipe_id', 'tag_id'
+        ).iterator():
+            tags.setdefault(recipe_id, set()).add(tag_id)
+        postings = {}
+        for recipe_id, cooking_time in recipes.values_list(
+                'id', 'cooking_time'
+        ).iterator():
+            if recipe_id not in ingredients:
+                continue
+            self.cooking_times[recipe_id] = cooking_time
+            self.tags[recipe_id] = frozenset(tags.get(recipe_id, ()))
+            self.ingredients[recipe_id] = ingredients[recipe_id]
+            for ingredient_id in ingredients[recipe_id]:
+                postings.setdefault(ingredient_id, []).append(recipe_id)
+        for ingredient_id, recipe_ids in postings.items():
+            current = self.postings.get(ingredient_id, ())
+            self.postings[ingredient_id] = array(
+                'I', [*current, *recipe_ids]
+            )
+        return self
+
+    def update(self, recipe_ids):
+        """Копия индекса с перечитанными из базы изменёнными и удалёнными
+        рецептами.
+
+        Словари копируются поверхностно, массивы общие: они не меняются,
+        а заменяются новыми.
+        """
+        recipe_ids = set(recipe_ids)
+        index = PantryIndex()
+        index.postings = dict(self.postings)
+        index.ingredients = dict(self.ingredients)
+        index.cooking_times = dict(self.cooking_times)
+        index.tags = dict(self.tags)
+        affected = {}
+        for recipe_id in recipe_ids:
+            for ingredient_id in index.ingredients.pop(recipe_id, ()):
+                affected.setdefault(ingredient_id, set()).add(recipe_id)
+            index.cooking_times.pop(recipe_id, None)
+            index.tags.pop(recipe_id, None)
+        for ingredient_id, removed in affected.items():
+            index.postings[ingredient_id] = array('I', [
+                recipe_id for recipe_id in index.postings[ingredient_id]
+                if recipe_id not in removed
+            ])
+        return index.load(recipe_ids)
+
+    def match(self, ingredient_ids, tag_ids=None, max_cooking_time=None):
+        """Рецепты, в которых есть хотя бы один из ингредиентов.
+
+        Возвращает кортежи (recipe_id, найдено, всего) по убыванию доли
+        найденных ингредиентов, затем их числа.
+        """
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(self.postings.get(ingredient_id, ()))
+        if tag_ids is not None:
+            tag_ids = set(tag_ids)
+            matched = {
+                recipe_id: count for recipe_id, count in matched.items()
+                if not self.tags[recipe_id].isdisjoint(tag_ids)
+            }
+        if max_cooking_time is not None:
+            matched = {
+                recipe_id: count for recipe_id, count in matched.items()
+                if self.cooking_times[recipe_id] <= max_cooking_time
+            }
+        return sorted(
+            (
+                (recipe_id, count, len(self.ingredients[recipe_id]))
+                for recipe_id, count in matched.items()
+            ),
+            key=lambda row: (row[1] / row[2], row[1], row[0]),
+            reverse=True,
+        )
+
+
+def get_sequence():
+    sequence = cache.get(SEQUENCE_KEY)
+    if sequence is None:
+        cache.add(SEQUENCE_KEY, 0, timeout=None)
+        sequence = cache.get(SEQUENCE_KEY)
+    return sequence
+
+
+def _increment_sequence(delta=1):
+    try:
+        return cache.incr(SEQUENCE_KEY, delta)
+    except ValueError:
+        get_sequence()
+        return cache.incr(SEQUENCE_KEY, delta)
+
+
+def record_recipe_change(recipe_id):
+    """Записывает изменённый рецепт в общий журнал изменений."""
+    cache.set(
+        CHANGE_KEY.format(_increment_sequence()), recipe_id,
+        timeout=PANTRY_JOURNAL_TIMEOUT,
+    )
+
+
+def reset_pantry_index():
+    """Заставляет все процессы перестроить индекс целиком."""
+    _increment_sequence(PANTRY_JOURNAL_SIZE + 1)
+
+
+_lock = threading.Lock()
+_index = None
+_index_sequence = None
+
+
+def _read_changes(start, stop):
+    if stop - start > PANTRY_JOURNAL_SIZE:
+        return None
+    keys = [CHANGE_KEY.format(number) for number in range(start + 1, stop + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys):
+        return None
+    return set(changes.values())
+
+
+def get_pantry_index():
+    """Лениво строит индекс и догоняет его по журналу изменений.
+
+    Если журнал переполнен или потерян, индекс строится заново.
+    """
+    global _index, _index_sequence
+    sequence = get_sequence()
+    if _index is None or _index_sequence != sequence:
+        with _lock:
+            if _index is None or _index_sequence != sequence:
+                changes = None
+                if _index is not None and _index_sequence < sequence:
+                    changes = _read_changes(_index_sequence, sequence)
+                if changes is None:
+                    _index = PantryIndex().load()
+                else:
+                    _index = _index.update(changes)
+                _index_sequence = sequence
+    return _index
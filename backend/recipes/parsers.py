@@ -0,0 +1,19 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from recipes.renderers import ORJSONRenderer, orjson
+
+
+class ORJSONParser(JSONParser):
+    """JSONParser на orjson; без orjson и для не-UTF-8 — стандартный."""
+
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        if orjson is None or encoding.lower() not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -0,0 +1,72 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+encoder = JSONEncoder()
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Рендерер формата списка покупок.
+
+    Сам файл отдаётся потоково из представления, рендерер нужен для
+    выбора формата через ?format= и отрисовки ответов с ошибками.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return str(data).encode('utf-8')
+
+
+class TxtShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson с тем же результатом.
+
+    Даты и Decimal кодируются стандартным кодировщиком DRF. С отступами
+    (браузерный API, ?indent=) и без orjson работает JSONRenderer.
+    """
+
+    options = (
+        orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if orjson is not None else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+                orjson is None or self.ensure_ascii
+                or self.get_indent(
+                    accepted_media_type, renderer_context or {}
+                ) is not None
+        ):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        if data is None:
+            return b''
+        content = orjson.dumps(
+            data, default=encoder.default, option=self.options
+        )
+        return content.replace(
+            '\u2028'.encode(), b'\\u2028'
+        ).replace('\u2029'.encode(), b'\\u2029')
@@ -0,0 +1,112 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
+
+from recipes.images import variant_names
+from recipes.models import Recipe, RecipeIngredient
+from recipes.serializers import RecipeSerializer
+from users.serializers import UserSerializer
+
+User = get_user_model()
+
+RECIPE_VALUES = (
+    'id', 'author_id', 'name', 'image', 'image_variants', 'text',
+    'cooking_time', 'pub_date',
+)
+FLAGS = ('is_favorited', 'is_in_shopping_cart')
+
+
+def recipe_values(queryset, request):
+    """Строки рецептов для represent_recipes вместо экземпляров модели."""
+    if request.auth:
+        return queryset.with_user_flags(request.user).values(
+            *RECIPE_VALUES, *FLAGS
+        )
+    return queryset.values(*RECIPE_VALUES)
+
+
+def get_authors(author_ids, request):
+    authors = User.objects.filter(id__in=author_ids)
+    fields = UserSerializer.Meta.fields
+    values = [field for field in fields if field != 'is_subscribed']
+    if request.user.is_authenticated:
+        authors = authors.annotate(
+            is_subscribed=Exists(
+                User.followings.through.objects.filter(
+                    from_usermodel_id=request.user.id,
+                    to_usermodel_id=OuterRef('pk'),
+                )
+            )
+        )
+        values.append('is_subscribed')
+    return {
+        author['id']: {field: author.get(field, False) for field in fields}
+        for author in authors.values(*values)
+    }
+
+
+def get_tags(recipe_ids):
+    tags = {recipe_id: [] for recipe_id in recipe_ids}
+    for recipe_id, *tag in Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+    ).order_by('tag__name').values_list(
+        'recipe_id', 'tag_id', 'tag__name', 'tag__color', 'tag__slug'
+    ):
+        tags[recipe_id].append(
+            dict(zip(('id', 'name', 'color', 'slug'), tag))
+        )
+    return tags
+
+
+def get_ingredients(recipe_ids):
+    ingredients = {recipe_id: [] for recipe_id in recipe_ids}
+    for recipe_id, *ingredient in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+    ).order_by('id').values_list(
+        'recipe_id', 'ingredient_id', 'ingredient__name',
+        'ingredient__measurement_unit', 'amount'
+    ):
+        ingredients[recipe_id].append(
+            dict(zip(('id', 'name', 'measurement_unit', 'amount'), ingredient))
+        )
+    return ingredients
+
+
+def represent_recipes(rows, request):
+    """Представление рецептов в формате RecipeSerializer только для чтения.
+
+    Строится из словарей values() тремя запросами на страницу, без
+    экземпляров моделей и объектов полей сериализаторов.
+    """
+    recipe_ids = [row['id'] for row in rows]
+    authors = get_authors({row['author_id'] for row in rows}, request)
+    tags = get_tags(recipe_ids)
+    ingredients = get_ingredients(recipe_ids)
+    storage = Recipe._meta.get_field('image').storage
+    urls = {}
+
+    def url(name):
+        if name not in urls:
+            urls[name] = request.build_absolute_uri(storage.url(name))
+        return urls[name]
+
+    fields = RecipeSerializer.Meta.fields
+    result = []
+    for row in rows:
+        image = row['image']
+        values = {
+            **row,
+            'tags': tags[row['id']],
+            'author': authors[row['author_id']],
+            'ingredients': ingredients[row['id']],
+            'is_favorited': row.get('is_favorited', False),
+            'is_in_shopping_cart': row.get('is_in_shopping_cart', False),
+            'image': url(image) if image else None,
+            'image_variants': {
+                variant: url(name)
+                for variant, name in variant_names(
+                    image, row['image_variants']
+                ).items()
+            } if image else None,
+        }
+        result.append({field: values[field] for field in fields})
+    return result
@@ -0,0 +1,39 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+
+
+def fts5_query(value):
+    """Экранирует слова запроса для FTS5 и ищет их по префиксу."""
+    return ' '.join(
+        '"{}"*'.format(word.replace('"', '""')) for word in value.split()
+    )
+
+
+def search_recipes(queryset, value):
+    """Полнотекстовый поиск по названию и описанию с ранжированием.
+
+    На PostgreSQL используется хранимый tsvector с GIN-индексом,
+    на SQLite — таблица FTS5.
+    """
+    if not value.split():
+        return queryset
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', '-pub_date', 'id')
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[
+            f'{FTS_TABLE}.rowid = recipes_recipe.id',
+            f'{FTS_TABLE} MATCH %s',
+        ],
+        params=[fts5_query(value)],
+        select={'search_rank': f'bm25({FTS_TABLE}, 10.0, 1.0)'},
+    ).order_by('search_rank', '-pub_date', 'id')
@@ -1,11 +1,21 @@
-import base64
+import binascii
+from tempfile import SpooledTemporaryFile
 
 import webcolors
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
 from rest_framework import serializers
 
+from recipes.constants import (BASE64_CHUNK_SIZE, BATCH_MAX_SIZE,
+                               IMAGE_SIGNATURES)
+from recipes.images import variant_names
 from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.shopping_list import apply_cart_deltas, get_cart_user_ids
+from recipes.similar import refresh_similar_recipes
+from recipes.versions import bump_version
+from users.membership import get_user_membership
 from users.serializers import UserSerializer
 
 User = get_user_model()
@@ -24,14 +34,93 @@ class Hex2NameColor(serializers.Field):
 
 
 class Base64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'too_large': 'Размер изображения превышает {max_size} байт.',
+        'invalid_base64': 'Изображение повреждено: некорректный base64.',
+        'invalid_signature': 'Файл не является изображением.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-
+            data = self.decode(data)
         return super().to_internal_value(data)
 
+    def decode(self, data):
+        """Декодирует base64 по частям во временный файл.
+
+        Размер проверяется до декодирования по длине строки и по мере
+        записи, заголовок файла — до разбора изображения Pillow.
+        """
+        separator = data.find(';base64,')
+        if separator == -1:
+            self.fail('invalid_base64')
+        content_type = data[len('data:'):separator]
+        start = separator + len(';base64,')
+        max_size = settings.MAX_IMAGE_SIZE
+        if (len(data) - start) // 4 * 3 > max_size + 2:
+            self.fail('too_large', max_size=max_size)
+        file = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        size = 0
+        tail = ''
+        for position in range(start, len(data), BASE64_CHUNK_SIZE):
+            chunk = tail + ''.join(
+                data[position:position + BASE64_CHUNK_SIZE].split()
+            )
+            cut = len(chunk) - len(chunk) % 4
+            chunk, tail = chunk[:cut], chunk[cut:]
+            try:
+                decoded = binascii.a2b_base64(chunk)
+            except binascii.Error:
+                self.fail('invalid_base64')
+            if size == 0 and not decoded.startswith(IMAGE_SIGNATURES) and (
+                    decoded[:4] != b'RIFF' or decoded[8:12] != b'WEBP'
+            ):
+                self.fail('invalid_signature')
+            size += len(decoded)
+            if size > max_size:
+                self.fail('too_large', max_size=max_size)
+            file.write(decoded)
+        if tail or size == 0:
+            self.fail('invalid_base64')
+        file.seek(0)
+        return UploadedFile(
+            file=file,
+            name='temp.' + content_type.split('/')[-1],
+            content_type=content_type,
+            size=size,
+        )
+
+
+class ImageVariantsField(serializers.Field):
+    """Ссылки на миниатюры и WebP-версии изображения рецепта.
+
+    Пока версии не готовы, для каждой отдаётся исходное изображение.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        storage = recipe.image.storage
+        urls = {
+            variant: storage.url(name) for variant, name in variant_names(
+                recipe.image.name, recipe.image_variants
+            ).items()
+        }
+        request = self.context.get('request')
+        if request is None:
+            return urls
+        return {
+            variant: request.build_absolute_uri(url)
+            for variant, url in urls.items()
+        }
+
 
 class TagSerializer(serializers.ModelSerializer):
     color = Hex2NameColor()
@@ -73,24 +162,34 @@ class RecipeSerializer(serializers.ModelSerializer):
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
     text = serializers.CharField()
     image = Base64ImageField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time',
+            'is_in_shopping_cart', 'name', 'image', 'image_variants', 'text',
+            'cooking_time',
         )
         read_only_fields = ('id',)
 
     def get_is_favorited(self, obj):
         if not self.context['request'].auth:
             return False
-        return obj in self.context['request'].user.favorites.all()
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        return obj.id in get_user_membership(
+            self.context['request']
+        ).favorites
 
     def get_is_in_shopping_cart(self, obj):
         if not self.context['request'].auth:
             return False
-        return obj in self.context['request'].user.shopping_cart.all()
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        return obj.id in get_user_membership(
+            self.context['request']
+        ).shopping_cart
 
     @staticmethod
     def validate_tags(value):
@@ -118,6 +217,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             )
         return value
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         validated_data['author_id'] = self.context['request'].user.id
@@ -130,19 +230,71 @@ class RecipeSerializer(serializers.ModelSerializer):
             ) for ingredient in ingredients
         ]
         RecipeIngredient.objects.bulk_create(recipeingredients)
+        transaction.on_commit(lambda: bump_version(RecipeIngredient))
+        transaction.on_commit(lambda: refresh_similar_recipes(recipe.id))
         return recipe
 
+    @staticmethod
+    def update_ingredients(instance, ingredients):
+        """Приводит ингредиенты рецепта к новому набору минимальным числом
+        запросов и возвращает True, если набор изменился.
+
+        Итоги списков покупок для созданных и изменённых строк правятся
+        здесь, для удалённых — сигналом post_delete.
+        """
+        current = {
+            recipeingredient.ingredient_id: recipeingredient
+            for recipeingredient in RecipeIngredient.objects.filter(
+                recipe=instance
+            ).only('id', 'ingredient_id', 'amount')
+        }
+        amounts = {
+            ingredient['ingredient_id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        deltas = {}
+        created, updated = [], []
+        for ingredient_id, amount in amounts.items():
+            recipeingredient = current.get(ingredient_id)
+            if recipeingredient is None:
+                created.append(RecipeIngredient(
+                    recipe=instance, ingredient_id=ingredient_id,
+                    amount=amount,
+                ))
+                deltas[ingredient_id] = amount
+            elif recipeingredient.amount != amount:
+                deltas[ingredient_id] = amount - recipeingredient.amount
+                recipeingredient.amount = amount
+                updated.append(recipeingredient)
+        deleted = [
+            recipeingredient for ingredient_id, recipeingredient
+            in current.items() if ingredient_id not in amounts
+        ]
+        if deleted:
+            RecipeIngredient.objects.filter(
+                id__in=[recipeingredient.id for recipeingredient in deleted]
+            ).delete()
+        if updated:
+            RecipeIngredient.objects.bulk_update(updated, ('amount',))
+        if created:
+            RecipeIngredient.objects.bulk_create(created)
+        if deltas:
+            apply_cart_deltas(get_cart_user_ids((instance.id,)), deltas)
+        return bool(deltas or deleted)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients')
-        instance.ingredients.all().delete()
-        recipeingredients = [
-            RecipeIngredient(
-                recipe=instance,
-                ingredient=ingredient['ingredient_id'],
-                amount=ingredient['amount'],
-            ) for ingredient in ingredients
-        ]
-        RecipeIngredient.objects.bulk_create(recipeingredients)
+        changed = self.update_ingredients(instance, ingredients)
+        if changed:
+            transaction.on_commit(lambda: bump_version(RecipeIngredient))
+        tags = validated_data.get('tags')
+        if changed or tags is not None and {tag.id for tag in tags} != set(
+                instance.tags.values_list('id', flat=True)
+        ):
+            transaction.on_commit(
+                lambda: refresh_similar_recipes(instance.id)
+            )
         return super().update(instance, validated_data)
 
 
@@ -153,16 +305,50 @@ class RecipeWriteSerializer(RecipeSerializer):
 
 
 class RecipeShortSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time',)
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time',)
+
+
+class IdListSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=BATCH_MAX_SIZE,
+    )
+
+
+class PantryQuerySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=BATCH_MAX_SIZE,
+    )
+    tags = serializers.ListField(
+        child=serializers.SlugField(), required=False
+    )
+    cooking_time = serializers.IntegerField(min_value=1, required=False)
+
+
+class PantryRecipeSerializer(RecipeShortSerializer):
+    coverage = serializers.FloatField(read_only=True)
+    missing_count = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeShortSerializer.Meta):
+        fields = (*RecipeShortSerializer.Meta.fields, 'coverage',
+                  'missing_count',)
+
+
+def get_recipes_limit(request):
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit is not None and recipes_limit.isdigit():
+        return int(recipes_limit)
+    return None
 
 
 class UserFollowingSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -172,18 +358,15 @@ class UserFollowingSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        return self.context['request'].user.followings.filter(
-            id=obj.id).exists()
+        return obj.id in get_user_membership(
+            self.context['request']
+        ).followings
 
     def get_recipes(self, obj):
-        recipes = obj.recipes.all()
-        recipes_limit = self.context.get('request').query_params.get(
-            'recipes_limit'
-        )
-        if recipes_limit is not None and recipes_limit.isdigit():
-            recipes = recipes[:int(recipes_limit)]
+        recipes = getattr(obj, 'latest_recipes', None)
+        if recipes is None:
+            recipes = obj.recipes.all()
+            recipes_limit = get_recipes_limit(self.context['request'])
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         return RecipeShortSerializer(recipes, many=True).data
-
-    @staticmethod
-    def get_recipes_count(obj):
-        return obj.recipes.count()
@@ -0,0 +1,294 @@
+import csv
+
+from django.contrib.auth import get_user_model
+from django.db.models import (Case, F, IntegerField, OuterRef, Subquery, Sum,
+                              Value, When)
+
+from recipes.models import RecipeIngredient, ShoppingCartTotal
+
+User = get_user_model()
+
+PDF_PAGE_WIDTH = 595
+PDF_PAGE_HEIGHT = 842
+PDF_MARGIN = 50
+PDF_FONT_SIZE = 11
+PDF_LEADING = 16
+PDF_LINES_PER_PAGE = (PDF_PAGE_HEIGHT - 2 * PDF_MARGIN) // PDF_LEADING
+
+
+def get_shopping_list(user):
+    """Читает готовые итоги списка покупок пользователя."""
+    return ShoppingCartTotal.objects.filter(user=user).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'amount'
+    ).order_by('ingredient__name')
+
+
+def change_cart_totals(user_ids, recipe_ids, sign=1):
+    """Прибавляет (sign=1) или вычитает (sign=-1) ингредиенты рецептов
+    из итогов списков покупок пользователей."""
+    user_ids, recipe_ids = list(user_ids), list(recipe_ids)
+    if not user_ids or not recipe_ids:
+        return
+    recipe_ingredients = RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    )
+    ingredient_ids = set(
+        recipe_ingredients.values_list('ingredient_id', flat=True)
+    )
+    ShoppingCartTotal.objects.bulk_create(
+        (
+            ShoppingCartTotal(
+                user_id=user_id, ingredient_id=ingredient_id, amount=0
+            )
+            for user_id in user_ids for ingredient_id in ingredient_ids
+        ),
+        ignore_conflicts=True,
+    )
+    recipe_amount = recipe_ingredients.filter(
+        ingredient_id=OuterRef('ingredient_id')
+    ).values('ingredient_id').annotate(total=Sum('amount')).values('total')
+    totals = ShoppingCartTotal.objects.filter(user_id__in=user_ids)
+    totals.filter(ingredient_id__in=ingredient_ids).update(
+        amount=F('amount') + sign * Subquery(recipe_amount)
+    )
+    totals.filter(amount__lte=0).delete()
+
+
+def apply_cart_deltas(user_ids, deltas):
+    """Изменяет итоги списков покупок пользователей на заданные
+    количества: deltas — словарь {ingredient_id: изменение}."""
+    user_ids = list(user_ids)
+    deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in deltas.items() if delta
+    }
+    if not user_ids or not deltas:
+        return
+    ShoppingCartTotal.objects.bulk_create(
+        (
+            ShoppingCartTotal(
+                user_id=user_id, ingredient_id=ingredient_id, amount=0
+            )
+            for user_id in user_ids
+            for ingredient_id, delta in deltas.items() if delta > 0
+        ),
+        ignore_conflicts=True,
+    )
+    totals = ShoppingCartTotal.objects.filter(user_id__in=user_ids)
+    totals.filter(ingredient_id__in=deltas).update(
+        amount=F('amount') + Case(
+            *(
+                When(ingredient_id=ingredient_id, then=Value(delta))
+                for ingredient_id, delta in deltas.items()
+            ),
+            output_field=IntegerField(),
+        )
+    )
+    totals.filter(amount__lte=0).delete()
+
+
+def get_cart_user_ids(recipe_ids):
+    """ID пользователей, у которых рецепты лежат в списке покупок."""
+    return set(
+        User.shopping_cart.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('usermodel_id', flat=True)
+    )
+
+
+def rebuild_cart_totals(users):
+    """Пересчитывает итоги списков покупок пользователей с нуля."""
+    ShoppingCartTotal.objects.filter(user__in=users).delete()
+    ShoppingCartTotal.objects.bulk_create(
+        ShoppingCartTotal(
+            user_id=row['recipe__cooking_chef'],
+            ingredient_id=row['ingredient_id'],
+            amount=row['total_amount'],
+        )
+        for row in RecipeIngredient.objects.filter(
+            recipe__cooking_chef__in=users
+        ).values('recipe__cooking_chef', 'ingredient_id').annotate(
+            total_amount=Sum('amount')
+        ).order_by().iterator()
+    )
+
+
+def format_line(name, measurement_unit, amount):
+    return f'{name} ({measurement_unit}) — {amount}'
+
+
+def render_txt(rows):
+    for row in rows:
+        yield (format_line(*row) + '\n').encode('utf-8')
+
+
+class _Echo:
+    """Псевдо-буфер для csv.writer: возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount')).encode(
+        'utf-8'
+    )
+    for row in rows:
+        yield writer.writerow(row).encode('utf-8')
+
+
+class StreamingPDFWriter:
+    """Минимальный PDF-писатель, отдающий документ постранично.
+
+    Объекты пишутся по мере готовности страниц, каталог, дерево страниц,
+    шрифт и таблица xref — в конце документа. Символы вне ASCII
+    кодируются однобайтовыми кодами 128-255 через /Differences
+    стандартного шрифта Helvetica.
+    """
+
+    CATALOG_ID = 1
+    PAGES_ID = 2
+    FONT_ID = 3
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+        self.next_id = self.FONT_ID + 1
+        self.page_ids = []
+        self.codes = {}
+
+    def _object(self, object_id, body):
+        self.offsets[object_id] = self.offset
+        chunk = b'%d 0 obj\n' % object_id + body + b'\nendobj\n'
+        self.offset += len(chunk)
+        return chunk
+
+    def _allocate(self):
+        object_id = self.next_id
+        self.next_id += 1
+        return object_id
+
+    def _encode(self, text):
+        result = bytearray()
+        for char in text:
+            code = ord(char)
+            if 32 <= code < 127:
+                if char in '\\()':
+                    result += b'\\'
+                result.append(code)
+                continue
+            if char not in self.codes:
+                if len(self.codes) >= 128:
+                    result += b'?'
+                    continue
+                self.codes[char] = 128 + len(self.codes)
+            result += b'\\%03o' % self.codes[char]
+        return bytes(result)
+
+    def header(self):
+        chunk = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        self.offset += len(chunk)
+        return chunk
+
+    def page(self, lines):
+        content = [
+            b'BT /F1 %d Tf %d TL %d %d Td' % (
+                PDF_FONT_SIZE, PDF_LEADING,
+                PDF_MARGIN, PDF_PAGE_HEIGHT - PDF_MARGIN,
+            )
+        ]
+        content.extend(b'(%s) Tj T*' % self._encode(line) for line in lines)
+        content.append(b'ET')
+        stream = b'\n'.join(content)
+        content_id = self._allocate()
+        page_id = self._allocate()
+        self.page_ids.append(page_id)
+        return self._object(
+            content_id,
+            b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream)
+        ) + self._object(
+            page_id,
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] '
+            b'/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>' % (
+                self.PAGES_ID, PDF_PAGE_WIDTH, PDF_PAGE_HEIGHT,
+                self.FONT_ID, content_id,
+            )
+        )
+
+    def _to_unicode(self):
+        mapping = b'\n'.join(
+            b'<%02X> <%04X>' % (code, ord(char))
+            for char, code in self.codes.items()
+        )
+        cmap = (
+            b'/CIDInit /ProcSet findresource begin 12 dict begin begincmap\n'
+            b'/CMapName /Foodgram-UCS def /CMapType 2 def\n'
+            b'1 begincodespacerange <00> <FF> endcodespacerange\n'
+            b'1 beginbfrange <20> <7E> <0020> endbfrange\n'
+            b'%d beginbfchar\n%s\nendbfchar\n'
+            b'endcmap CMapName currentdict /CMap defineresource pop end end'
+        ) % (len(self.codes), mapping)
+        return b'<< /Length %d >>\nstream\n%s\nendstream' % (len(cmap), cmap)
+
+    def trailer(self):
+        differences = b' '.join(
+            b'%d /uni%04X' % (code, ord(char))
+            for char, code in self.codes.items()
+        )
+        to_unicode_id = self._allocate()
+        chunks = [
+            self._object(to_unicode_id, self._to_unicode()),
+            self._object(
+                self.FONT_ID,
+                b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+                b'/Encoding << /Type /Encoding /BaseEncoding /WinAnsiEncoding '
+                b'/Differences [%s] >> /ToUnicode %d 0 R >>' % (
+                    differences, to_unicode_id,
+                )
+            ),
+            self._object(
+                self.PAGES_ID,
+                b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+                    b' '.join(b'%d 0 R' % page for page in self.page_ids),
+                    len(self.page_ids),
+                )
+            ),
+            self._object(
+                self.CATALOG_ID,
+                b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES_ID
+            ),
+        ]
+        size = self.next_id
+        xref = [b'xref\n0 %d\n0000000000 65535 f \n' % size]
+        xref.extend(
+            b'%010d 00000 n \n' % self.offsets[object_id]
+            for object_id in range(1, size)
+        )
+        chunks.append(b''.join(xref))
+        chunks.append(
+            b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+            % (size, self.CATALOG_ID, self.offset)
+        )
+        return b''.join(chunks)
+
+
+def render_pdf(rows):
+    writer = StreamingPDFWriter()
+    yield writer.header()
+    lines = []
+    for row in rows:
+        lines.append(format_line(*row))
+        if len(lines) == PDF_LINES_PER_PAGE:
+            yield writer.page(lines)
+            lines = []
+    if lines or not writer.page_ids:
+        yield writer.page(lines)
+    yield writer.trailer()
+
+
+RENDERERS = {
+    'txt': render_txt,
+    'csv': render_csv,
+    'pdf': render_pdf,
+}
@@ -0,0 +1,233 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from recipes.counters import change_counter, update_m2m_counter
+from recipes.feed import fill_timelines, trim_timelines
+from recipes.images import release_image, schedule_variants
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCartTotal, SimilarRecipe, Tag,
+                            TimelineEntry)
+from recipes.pantry_index import record_recipe_change, reset_pantry_index
+from recipes.shopping_list import (apply_cart_deltas, change_cart_totals,
+                                   get_cart_user_ids)
+from recipes.similar import recompute_similar_recipes
+from recipes.versions import bump_version
+
+User = get_user_model()
+
+
+@receiver(m2m_changed, sender=User.shopping_cart.through)
+def update_cart_totals(sender, instance, action, reverse, pk_set, **kwargs):
+    """Поддерживает итоги списков покупок при изменении корзины."""
+    if action in ('post_add', 'post_remove'):
+        sign = 1 if action == 'post_add' else -1
+        if reverse:
+            change_cart_totals(pk_set, (instance.id,), sign)
+        else:
+            change_cart_totals((instance.id,), pk_set, sign)
+    elif action == 'pre_clear':
+        if reverse:
+            change_cart_totals(
+                get_cart_user_ids((instance.id,)), (instance.id,), -1
+            )
+        else:
+            ShoppingCartTotal.objects.filter(user=instance).delete()
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_cart_totals(sender, instance, **kwargs):
+    """Вычитает рецепт из итогов и сразу убирает его из корзин, чтобы
+    каскадное удаление ингредиентов рецепта не вычло их второй раз."""
+    change_cart_totals(get_cart_user_ids((instance.id,)), (instance.id,), -1)
+    User.shopping_cart.through.objects.filter(recipe_id=instance.id).delete()
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_previous_amount(sender, instance, **kwargs):
+    instance._previous_amount = None
+    if instance.pk:
+        instance._previous_amount = RecipeIngredient.objects.filter(
+            pk=instance.pk
+        ).values('recipe_id', 'ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def update_cart_totals_on_save(sender, instance, **kwargs):
+    """Переносит изменение ингредиента рецепта в итоги списков покупок.
+
+    Массовые bulk_create и bulk_update сигналов не шлют: их изменения
+    вызывающий код передаёт в apply_cart_deltas сам.
+    """
+    deltas = {instance.ingredient_id: instance.amount}
+    previous = getattr(instance, '_previous_amount', None)
+    if previous and previous['recipe_id'] != instance.recipe_id:
+        apply_cart_deltas(
+            get_cart_user_ids((previous['recipe_id'],)),
+            {previous['ingredient_id']: -previous['amount']},
+        )
+    elif previous:
+        deltas[previous['ingredient_id']] = (
+            deltas.get(previous['ingredient_id'], 0) - previous['amount']
+        )
+    apply_cart_deltas(get_cart_user_ids((instance.recipe_id,)), deltas)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def update_cart_totals_on_delete(sender, instance, **kwargs):
+    apply_cart_deltas(
+        get_cart_user_ids((instance.recipe_id,)),
+        {instance.ingredient_id: -instance.amount},
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_ingredient_version(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(Ingredient))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tag_version(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(Tag))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def bump_recipe_version(sender, **kwargs):
+    """Версия меняется после коммита, чтобы параллельный запрос не
+    закэшировал старые данные под новой версией."""
+    transaction.on_commit(lambda: bump_version(Recipe))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_tags_version(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(lambda: bump_version(Recipe))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def bump_recipe_ingredient_version(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(RecipeIngredient))
+
+
+@receiver(m2m_changed, sender=User.favorites.through)
+def update_favorites_count(sender, **kwargs):
+    update_m2m_counter(
+        Recipe, 'favorites_count', 'usermodel_id', 'recipe_id',
+        sender=sender, **kwargs
+    )
+
+
+@receiver(m2m_changed, sender=User.shopping_cart.through)
+def update_shopping_cart_count(sender, **kwargs):
+    update_m2m_counter(
+        Recipe, 'shopping_cart_count', 'usermodel_id', 'recipe_id',
+        sender=sender, **kwargs
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', 1
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    """Добавляет новый рецепт в ленты подписчиков автора."""
+    if created:
+        fill_timelines(
+            author_ids=(instance.author_id,), recipe_ids=(instance.id,)
+        )
+
+
+@receiver(m2m_changed, sender=User.followings.through)
+def update_timelines(sender, instance, action, reverse, pk_set, **kwargs):
+    """Дополняет ленты при подписке и чистит их при отписке."""
+    if action in ('post_add', 'post_remove'):
+        user_ids, author_ids = (
+            (pk_set, (instance.id,)) if reverse else ((instance.id,), pk_set)
+        )
+        if action == 'post_add':
+            fill_timelines(user_ids=user_ids, author_ids=author_ids)
+        else:
+            trim_timelines(user_ids, author_ids)
+    elif action == 'pre_clear':
+        TimelineEntry.objects.filter(
+            **{'author' if reverse else 'user': instance}
+        ).delete()
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    change_counter(
+        User.objects.filter(pk=instance.author_id), 'recipes_count', -1
+    )
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_previous_image(sender, instance, **kwargs):
+    instance._previous_image = None
+    if instance.pk:
+        instance._previous_image = Recipe.objects.filter(
+            pk=instance.pk
+        ).values('image', 'image_variants').first()
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_image', None)
+    if previous and previous['image'] != instance.image.name:
+        transaction.on_commit(
+            lambda: release_image(
+                previous['image'], previous['image_variants']
+            )
+        )
+    schedule_variants(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_image(sender, instance, **kwargs):
+    name, variants = instance.image.name, instance.image_variants
+    transaction.on_commit(lambda: release_image(name, variants))
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_similar_lists(sender, instance, **kwargs):
+    instance._listed_as_similar = set(
+        SimilarRecipe.objects.filter(
+            similar=instance
+        ).values_list('recipe_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def refill_similar_lists(sender, instance, **kwargs):
+    """Дополняет списки похожих, из которых пропал удалённый рецепт."""
+    listed_by = getattr(instance, '_listed_as_similar', set())
+    if listed_by:
+        recompute_similar_recipes(listed_by)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def record_pantry_change(sender, instance, **kwargs):
+    """Отмечает рецепт для обновления индекса подбора по продуктам.
+
+    Запись делается после коммита, когда ингредиенты и теги рецепта уже
+    сохранены.
+    """
+    recipe_id = instance.id
+    transaction.on_commit(lambda: record_recipe_change(recipe_id))
+
+
+@receiver(post_delete, sender=Ingredient)
+def reset_pantry_after_ingredient_delete(sender, **kwargs):
+    transaction.on_commit(reset_pantry_index)
@@ -0,0 +1,260 @@
+import heapq
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Min, Q
+
+from recipes.constants import (SIMILAR_MAX_POSTINGS, SIMILAR_RECIPES_LIMIT,
+                               SIMILAR_TAG_WEIGHT)
+from recipes.models import Recipe, RecipeIngredient, SimilarRecipe
+
+
+def load_features(recipe_ids=None):
+    """Ингредиенты и теги рецептов: {recipe_id: (ингредиенты, теги)}."""
+    ingredients = RecipeIngredient.objects.all()
+    tags = Recipe.tags.through.objects.all()
+    if recipe_ids is not None:
+        ingredients = ingredients.filter(recipe_id__in=recipe_ids)
+        tags = tags.filter(recipe_id__in=recipe_ids)
+    features = defaultdict(lambda: (set(), set()))
+    for recipe_id, ingredient_id in ingredients.values_list(
+            'recipe_id', 'ingredient_id'
+    ).iterator():
+        features[recipe_id][0].add(ingredient_id)
+    for recipe_id, tag_id in tags.values_list(
+            'recipe_id', 'tag_id'
+    ).iterator():
+        if recipe_id in features:
+            features[recipe_id][1].add(tag_id)
+    return dict(features)
+
+
+class SimilarityIndex:
+    """Инвертированный индекс ингредиент → рецепты.
+
+    Число общих ингредиентов рецепта с остальными — строка произведения
+    разреженной матрицы рецепт×ингредиент на транспонированную; она
+    считается сложением списков рецептов по ингредиентам в Counter.
+    Слишком частые ингредиенты (соль, вода) не учитываются вовсе.
+    Общие теги добавляют к сходству SIMILAR_TAG_WEIGHT каждый.
+    """
+
+    def __init__(self, features, frequent=None):
+        self.features = features
+        self.postings = defaultdict(list)
+        for recipe_id, (ingredients, _) in features.items():
+            for ingredient_id in ingredients:
+                self.postings[ingredient_id].append(recipe_id)
+        if frequent is None:
+            frequent = {
+                ingredient_id
+                for ingredient_id, postings in self.postings.items()
+                if len(postings) > SIMILAR_MAX_POSTINGS
+            }
+        self.frequent = set(frequent)
+
+    def shared_ingredients(self, recipe_id):
+        shared = Counter()
+        for ingredient_id in self.features[recipe_id][0] - self.frequent:
+            shared.update(self.postings[ingredient_id])
+        shared.pop(recipe_id, None)
+        return shared
+
+    def score(self, tags, candidate, shared):
+        return shared + SIMILAR_TAG_WEIGHT * len(
+            tags & self.features[candidate][1]
+        )
+
+    def scores(self, recipe_id):
+        tags = self.features[recipe_id][1]
+        return [
+            (self.score(tags, candidate, shared), candidate)
+            for candidate, shared in self.shared_ingredients(
+                recipe_id
+            ).items()
+        ]
+
+    def neighbours(self, recipe_id, limit=SIMILAR_RECIPES_LIMIT):
+        shared = self.shared_ingredients(recipe_id)
+        if not shared:
+            return []
+        tags = self.features[recipe_id][1]
+        threshold = heapq.nlargest(limit, shared.values())[-1] - (
+            SIMILAR_TAG_WEIGHT * len(tags)
+        )
+        return heapq.nlargest(limit, [
+            (self.score(tags, candidate, count), candidate)
+            for candidate, count in shared.items() if count >= threshold
+        ])
+
+
+def get_local_index(recipe_ids):
+    """Индекс по рецептам и их кандидатам, прочитанный из базы."""
+    ingredient_ids = RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values('ingredient_id')
+    frequent = list(
+        RecipeIngredient.objects.filter(
+            ingredient_id__in=ingredient_ids
+        ).values('ingredient_id').annotate(
+            recipes=Count('id')
+        ).filter(
+            recipes__gt=SIMILAR_MAX_POSTINGS
+        ).values_list('ingredient_id', flat=True)
+    )
+    candidates = RecipeIngredient.objects.filter(
+        Q(ingredient_id__in=ingredient_ids)
+        & ~Q(ingredient_id__in=frequent)
+        | Q(recipe_id__in=recipe_ids)
+    ).values('recipe_id')
+    return SimilarityIndex(load_features(candidates), frequent)
+
+
+def make_entries(recipe_id, neighbours):
+    return [
+        SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id, score=score)
+        for score, similar_id in neighbours
+    ]
+
+
+@transaction.atomic
+def recompute_similar_recipes(recipe_ids):
+    """Пересчитывает списки похожих для рецептов по одному."""
+    SimilarRecipe.objects.filter(recipe_id__in=recipe_ids).delete()
+    entries = []
+    for recipe_id in recipe_ids:
+        index = get_local_index([recipe_id])
+        if recipe_id in index.features:
+            entries.extend(
+                make_entries(recipe_id, index.neighbours(recipe_id))
+            )
+    SimilarRecipe.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+@transaction.atomic
+def refresh_similar_recipes(recipe_id):
+    """Обновляет похожие рецепты после изменения ингредиентов или тегов.
+
+    Пересчитываются список самого рецепта и списки, в которых он уже
+    был; в остальные списки кандидатов рецепт вставляется, только если
+    проходит в их top-K. Вызывается после коммита, поэтому параллельное
+    обновление могло уже вставить ту же пару: такие записи пропускаются.
+    """
+    listed_by = set(
+        SimilarRecipe.objects.filter(
+            similar_id=recipe_id
+        ).values_list('recipe_id', flat=True)
+    )
+    SimilarRecipe.objects.filter(
+        Q(recipe_id=recipe_id) | Q(similar_id=recipe_id)
+    ).delete()
+    index = get_local_index([recipe_id])
+    if recipe_id not in index.features:
+        recompute_similar_recipes(listed_by)
+        return
+    scores = index.scores(recipe_id)
+    SimilarRecipe.objects.bulk_create(
+        make_entries(
+            recipe_id, heapq.nlargest(SIMILAR_RECIPES_LIMIT, scores)
+        ),
+        ignore_conflicts=True,
+    )
+    enter_similar_lists([
+        (score, candidate, recipe_id) for score, candidate in scores
+        if candidate not in listed_by
+    ])
+    recompute_similar_recipes(listed_by)
+
+
+@transaction.atomic
+def add_similar_recipes(recipe_ids):
+    """Добавляет в похожие пачку новых рецептов, например после импорта.
+
+    Индекс строится по новым рецептам и их кандидатам, поэтому память
+    зависит от размера пачки, а не каталога. Списки новых рецептов
+    считаются целиком, в списки остальных кандидатов новые рецепты
+    вставляются, только если проходят в их top-K.
+    """
+    index = get_local_index(recipe_ids)
+    recipe_ids = [
+        recipe_id for recipe_id in recipe_ids if recipe_id in index.features
+    ]
+    added = set(recipe_ids)
+    entries, entering = [], []
+    for recipe_id in recipe_ids:
+        scores = index.scores(recipe_id)
+        entries.extend(make_entries(
+            recipe_id, heapq.nlargest(SIMILAR_RECIPES_LIMIT, scores)
+        ))
+        entering.extend(
+            (score, candidate, recipe_id) for score, candidate in scores
+            if candidate not in added
+        )
+    SimilarRecipe.objects.bulk_create(entries, ignore_conflicts=True)
+    enter_similar_lists(entering)
+
+
+def enter_similar_lists(scores):
+    """Вставляет рецепты в списки похожих кандидатов, если проходят в
+    top-K.
+
+    scores — кортежи (сходство, кандидат, рецепт).
+    """
+    lists = {
+        row['recipe_id']: row for row in SimilarRecipe.objects.filter(
+            recipe_id__in={candidate for _, candidate, _ in scores}
+        ).values('recipe_id').annotate(
+            entries=Count('id'), lowest=Min('score')
+        )
+    }
+    entering = []
+    for score, candidate, recipe_id in scores:
+        row = lists.get(candidate)
+        if (
+                row is None or row['entries'] < SIMILAR_RECIPES_LIMIT
+                or score >= row['lowest']
+        ):
+            entering.append(SimilarRecipe(
+                recipe_id=candidate, similar_id=recipe_id, score=score
+            ))
+    SimilarRecipe.objects.bulk_create(entering, ignore_conflicts=True)
+    entered = Counter(entry.recipe_id for entry in entering)
+    trim_similar_recipes([
+        candidate for candidate, count in entered.items()
+        if count + lists.get(candidate, {}).get('entries', 0)
+        > SIMILAR_RECIPES_LIMIT
+    ])
+
+
+def trim_similar_recipes(recipe_ids):
+    """Оставляет в списках рецептов только top-K записей."""
+    if not recipe_ids:
+        return
+    lists = defaultdict(list)
+    for entry_id, recipe_id, similar_id, score in (
+            SimilarRecipe.objects.filter(recipe_id__in=recipe_ids)
+            .values_list('id', 'recipe_id', 'similar_id', 'score')
+    ):
+        lists[recipe_id].append((score, similar_id, entry_id))
+    SimilarRecipe.objects.filter(id__in=[
+        entry_id for entries in lists.values()
+        for _, _, entry_id in sorted(entries, reverse=True)[
+            SIMILAR_RECIPES_LIMIT:
+        ]
+    ]).delete()
+
+
+def rebuild_similar_recipes(batch_size=5000):
+    """Пересчитывает похожие рецепты для всего каталога."""
+    index = SimilarityIndex(load_features())
+    SimilarRecipe.objects.all().delete()
+    created = 0
+    entries = []
+    for recipe_id in index.features:
+        entries.extend(make_entries(recipe_id, index.neighbours(recipe_id)))
+        if len(entries) >= batch_size:
+            SimilarRecipe.objects.bulk_create(entries)
+            created += len(entries)
+            entries = []
+    SimilarRecipe.objects.bulk_create(entries)
+    return created + len(entries)
@@ -0,0 +1,56 @@
+import hashlib
+import os
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.utils.deconstruct import deconstructible
+
+
+def lock_name(name):
+    """Блокирует имя файла до конца текущей транзакции.
+
+    Загрузка, вернувшая имя существующего файла, и удаление файла без
+    ссылок идут под этой блокировкой. Поэтому удаление дожидается коммита
+    рецепта, получившего тот же файл. Блокировка берётся только на
+    PostgreSQL.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    key = int.from_bytes(
+        hashlib.sha256(name.encode()).digest()[:8], 'big', signed=True
+    )
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище с именами по SHA-256 содержимого.
+
+    Одинаковые файлы сохраняются один раз: повторная загрузка возвращает
+    имя уже существующего файла. Содержимое файла по имени никогда не
+    меняется, поэтому его можно кэшировать бессрочно.
+    """
+
+    def __init__(self, prefix='images', **kwargs):
+        self.prefix = prefix
+        super().__init__(**kwargs)
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        extension = os.path.splitext(name)[1].lower()
+        hexdigest = digest.hexdigest()
+        return f'{self.prefix}/{hexdigest[:2]}/{hexdigest}{extension}'
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        lock_name(name)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
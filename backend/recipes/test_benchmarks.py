@@ -0,0 +1,485 @@
+import csv
+import json
+import os
+import resource
+import tempfile
+import timeit
+from datetime import timedelta
+from io import StringIO
+from itertools import cycle, islice
+from random import Random
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.pagination import Cursor
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import (APIClient, APIRequestFactory,
+                                 force_authenticate)
+from rest_framework.views import APIView
+
+from recipes.compression import COMPRESSORS, compress
+from recipes.filters import RecipeFilter
+from recipes.ingredient_index import IngredientIndex, get_ingredient_index
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.pagination import RecipeCursorPagination
+from recipes.renderers import ORJSONRenderer
+from recipes.representations import recipe_values, represent_recipes
+from recipes.serializers import IngredientSerializer, RecipeSerializer
+from recipes.versions import bump_version
+
+User = get_user_model()
+
+RUN_BENCHMARKS = os.getenv('RUN_BENCHMARKS', default='False') == 'True'
+
+RECIPES_URL = '/api/recipes/'
+
+WORDS = (
+    'молоко', 'морковь', 'мука', 'масло', 'сахар', 'соль', 'сыр', 'сметана',
+    'картофель', 'капуста', 'клубника', 'яблоко', 'яйцо', 'лук', 'чеснок',
+    'перец', 'петрушка', 'говядина', 'горох', 'рис',
+)
+
+
+@skipUnless(RUN_BENCHMARKS, 'Бенчмарки запускаются с RUN_BENCHMARKS=True.')
+class BenchmarkTestCase(TestCase):
+    """Замеры производительности, по умолчанию пропускаются.
+
+    Печатает лучшее время из repeat повторов; число вызовов в повторе
+    подбирается так, чтобы повтор длился не меньше 0,2 с. Цифры имеют
+    смысл на PostgreSQL с объёмом данных, близким к продакшену.
+    """
+
+    repeat = 5
+
+    def report(self, label, value):
+        print(f'{type(self).__name__}: {label}: {value}')
+
+    def measure_once(self, label, function):
+        """Для долгих операций: один вызов и пиковый RSS процесса."""
+        seconds = timeit.Timer(function).timeit(number=1)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+        self.report(label, f'{seconds:.1f} с, пиковый RSS {peak} МБ')
+        return seconds
+
+    def measure(self, label, function):
+        timer = timeit.Timer(function)
+        number, _ = timer.autorange()
+        best = min(timer.repeat(self.repeat, number)) / number
+        self.report(label, f'{best * 1000:.3f} мс')
+        return best
+
+
+class IngredientAutocompleteBenchmark(BenchmarkTestCase):
+    """Автодополнение по индексу в памяти против ILIKE и сериализатора."""
+
+    ingredients_count = 50000
+    queries = ('м', 'мо', 'кап', 'перец 1', 'яйцо 4999')
+    limit = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(name=f'{word} {number}', measurement_unit='г')
+                for number, word in enumerate(
+                    islice(cycle(WORDS), cls.ingredients_count)
+                )
+            ),
+            batch_size=5000,
+        )
+        bump_version(Ingredient)
+
+    def test_autocomplete(self):
+        self.measure('построение индекса', lambda: IngredientIndex(
+            Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            ).iterator()
+        ))
+        index = get_ingredient_index()
+        for query in self.queries:
+            orm = IngredientSerializer(
+                Ingredient.objects.filter(name__istartswith=query), many=True
+            ).data
+            self.assertEqual(
+                {item['id'] for item in index.search(query)[:len(orm)]},
+                {item['id'] for item in orm},
+            )
+            self.measure(f'ORM, {query!r}', lambda: IngredientSerializer(
+                Ingredient.objects.filter(name__istartswith=query), many=True
+            ).data)
+            self.measure(
+                f'индекс, {query!r}', lambda: index.search(query, self.limit)
+            )
+
+
+class IngredientImportBenchmark(BenchmarkTestCase):
+    """Загрузка миллиона ингредиентов командой loadingredients."""
+
+    rows_count = 1000000
+    units = ('г', 'кг', 'мл', 'л', 'шт')
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def get_rows(self):
+        for number in range(self.rows_count):
+            yield {
+                'name': f'ингредиент {number}',
+                'measurement_unit': self.units[number % len(self.units)],
+            }
+
+    def load(self, path):
+        call_command('loadingredients', path, stdout=StringIO())
+
+    def test_csv(self):
+        path = os.path.join(self.directory.name, 'ingredients.csv')
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.DictWriter(file, ('name', 'measurement_unit'))
+            writer.writeheader()
+            writer.writerows(self.get_rows())
+        self.measure_once('CSV', lambda: self.load(path))
+        self.assertEqual(Ingredient.objects.count(), self.rows_count)
+        self.measure_once('CSV повторно', lambda: self.load(path))
+        self.assertEqual(Ingredient.objects.count(), self.rows_count)
+
+    def test_json(self):
+        path = os.path.join(self.directory.name, 'ingredients.json')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('[')
+            for number, row in enumerate(self.get_rows()):
+                file.write(',' * bool(number) + json.dumps(row))
+            file.write(']')
+        self.measure_once('JSON', lambda: self.load(path))
+        self.assertEqual(Ingredient.objects.count(), self.rows_count)
+
+
+class CatalogMixin:
+    """Каталог рецептов с тегами, ингредиентами, избранным и корзиной.
+
+    Всё создаётся через bulk_create, сигналы не срабатывают, поэтому
+    версии моделей сбрасываются вручную.
+    """
+
+    recipes_count = 10000
+    authors_count = 50
+    ingredients_count = 500
+    ingredients_per_recipe = 10
+    tags_per_recipe = 3
+    text_words = 150
+    batch_size = 5000
+
+    @classmethod
+    def create_catalog(cls):
+        User.objects.bulk_create(
+            User(
+                username=f'author{number}',
+                email=f'author{number}@foodgram.ru',
+                first_name='Имя', last_name='Фамилия',
+            )
+            for number in range(cls.authors_count)
+        )
+        cls.user = User.objects.create_user(
+            username='user', email='user@foodgram.ru', password='password',
+            first_name='Имя', last_name='Фамилия',
+        )
+        author_ids = list(
+            User.objects.exclude(id=cls.user.id).values_list('id', flat=True)
+        )
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {number}', color='#ff0000', slug=f'tag{number}')
+            for number in range(6)
+        )
+        cls.tags = list(Tag.objects.order_by('id'))
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(cls.ingredients_count)
+        )
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+        words = Random(0)
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=author_ids[number % len(author_ids)],
+                    name=f'Рецепт {number}',
+                    text=' '.join(
+                        f'{words.choice(WORDS)}{words.randrange(1000)}'
+                        for _ in range(cls.text_words)
+                    ),
+                    image=f'recipes/images/{number}.png',
+                    cooking_time=number % 120 + 1,
+                )
+                for number in range(cls.recipes_count)
+            ),
+            batch_size=cls.batch_size,
+        )
+        recipes = list(Recipe.objects.order_by('id').only('id'))
+        now = timezone.now()
+        for number, recipe in enumerate(recipes):
+            recipe.pub_date = now - timedelta(
+                minutes=cls.recipes_count - number
+            )
+        Recipe.objects.bulk_update(
+            recipes, ['pub_date'], batch_size=cls.batch_size
+        )
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(
+                    recipe_id=recipe.id,
+                    tag_id=cls.tags[(number + shift) % len(cls.tags)].id,
+                )
+                for number, recipe in enumerate(recipes)
+                for shift in range(cls.tags_per_recipe)
+            ),
+            batch_size=cls.batch_size,
+        )
+        RecipeIngredient.objects.bulk_create(
+            (
+                RecipeIngredient(
+                    recipe_id=recipe.id,
+                    ingredient_id=ingredient_ids[
+                        (number * 7 + shift) % len(ingredient_ids)
+                    ],
+                    amount=shift + 1,
+                )
+                for number, recipe in enumerate(recipes)
+                for shift in range(cls.ingredients_per_recipe)
+            ),
+            batch_size=cls.batch_size,
+        )
+        cls.user.favorites.add(*recipes[::10])
+        cls.user.shopping_cart.add(*recipes[::50])
+        cls.token = Token.objects.create(user=cls.user)
+        for model in (User, Tag, Ingredient, Recipe, RecipeIngredient):
+            bump_version(model)
+
+    def get_client(self):
+        """Клиент с токеном: кэш ответов для него не используется."""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        return client
+
+    def get_request(self, params=None, authenticated=True):
+        request = APIRequestFactory().get(RECIPES_URL, params)
+        if authenticated:
+            force_authenticate(request, user=self.user, token=self.token)
+        return APIView().initialize_request(request)
+
+    def get_recipes(self, client, params=None, url=RECIPES_URL):
+        response = client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+
+class RecipePaginationBenchmark(CatalogMixin, BenchmarkTestCase):
+    """Первая и тысячная страницы в постраничном и курсорном режимах."""
+
+    page_size = 10
+    pages = (1, 1000)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_catalog()
+
+    def get_cursor_url(self, page):
+        """Ссылка на страницу page курсорного режима без прохода по
+        предыдущим страницам."""
+        if page == 1:
+            return f'{RECIPES_URL}?cursor=&limit={self.page_size}'
+        last = Recipe.objects.order_by('-pub_date', 'id')[
+            (page - 1) * self.page_size - 1
+        ]
+        paginator = RecipeCursorPagination()
+        paginator.base_url = f'{RECIPES_URL}?limit={self.page_size}'
+        return paginator.encode_cursor(
+            Cursor(offset=0, reverse=False, position=str(last.pub_date))
+        )
+
+    def test_pages(self):
+        client = self.get_client()
+        for page in self.pages:
+            params = {'page': page, 'limit': self.page_size}
+            cursor_url = self.get_cursor_url(page)
+            self.assertEqual(
+                self.get_recipes(client, params)['results'],
+                self.get_recipes(client, url=cursor_url)['results'],
+            )
+            self.measure(
+                f'постранично, страница {page}',
+                lambda: self.get_recipes(client, params),
+            )
+            self.measure(
+                f'курсор, страница {page}',
+                lambda: self.get_recipes(client, url=cursor_url),
+            )
+
+
+class RecipeTagFilterBenchmark(CatalogMixin, BenchmarkTestCase):
+    """Фильтр по нескольким тегам с автором, избранным и корзиной:
+    EXISTS по промежуточной таблице против JOIN с DISTINCT.
+
+    Замеряется то же, что делает постраничная пагинация: COUNT(*) и
+    первая страница.
+    """
+
+    page_size = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_catalog()
+        cls.author_id = Recipe.objects.values_list(
+            'author_id', flat=True
+        ).first()
+
+    def filter_join(self, params):
+        """Фильтрация JOIN-ами с DISTINCT, как до перехода на EXISTS."""
+        queryset = Recipe.objects.filter(tags__slug__in=params['tags'])
+        if 'author' in params:
+            queryset = queryset.filter(author=params['author'])
+        if 'is_favorited' in params:
+            queryset = queryset.filter(subscribers=self.user)
+        if 'is_in_shopping_cart' in params:
+            queryset = queryset.filter(cooking_chef=self.user)
+        return queryset.distinct()
+
+    def filter_exists(self, params):
+        return RecipeFilter(
+            params, queryset=Recipe.objects.all(),
+            request=self.get_request(params),
+        ).qs
+
+    def paginate(self, queryset):
+        return queryset.count(), list(
+            queryset.values_list('id', flat=True)[:self.page_size]
+        )
+
+    def test_filters(self):
+        slugs = [tag.slug for tag in self.tags]
+        combinations = {
+            'три тега': {'tags': slugs[:3]},
+            'два тега и автор': {
+                'tags': slugs[:2], 'author': self.author_id
+            },
+            'три тега и избранное': {'tags': slugs[:3], 'is_favorited': 1},
+            'два тега и корзина': {
+                'tags': slugs[:2], 'is_in_shopping_cart': 1
+            },
+        }
+        for label, params in combinations.items():
+            self.assertEqual(
+                self.paginate(self.filter_join(params)),
+                self.paginate(self.filter_exists(params)),
+            )
+            self.measure(
+                f'JOIN и DISTINCT, {label}',
+                lambda: self.paginate(self.filter_join(params)),
+            )
+            self.measure(
+                f'EXISTS, {label}',
+                lambda: self.paginate(self.filter_exists(params)),
+            )
+
+
+class RecipeRepresentationBenchmark(CatalogMixin, BenchmarkTestCase):
+    """Страница из 100 рецептов: represent_recipes против
+    RecipeSerializer, вместе с запросами к базе."""
+
+    page_size = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_catalog()
+
+    def test_page(self):
+        recipes = Recipe.objects.order_by('-pub_date', 'id')
+        for authenticated in (False, True):
+            request = self.get_request(authenticated=authenticated)
+            label = 'с токеном' if authenticated else 'аноним'
+
+            def serialize():
+                return RecipeSerializer(
+                    recipes.for_read(request.user)[:self.page_size],
+                    many=True, context={'request': request},
+                ).data
+
+            def represent():
+                return represent_recipes(
+                    list(recipe_values(recipes, request)[:self.page_size]),
+                    request,
+                )
+
+            self.assertEqual(
+                JSONRenderer().render(represent()),
+                JSONRenderer().render(serialize()),
+            )
+            for name, function in (
+                    ('RecipeSerializer', serialize),
+                    ('represent_recipes', represent),
+            ):
+                with CaptureQueriesContext(connection) as queries:
+                    function()
+                self.report(f'{name}, {label}, запросов', len(queries))
+                self.measure(f'{name}, {label}', function)
+
+
+class ResponseRenderingBenchmark(CatalogMixin, BenchmarkTestCase):
+    """Рендеринг и размер на проводе страницы из 100 рецептов."""
+
+    page_size = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_catalog()
+
+    def test_render(self):
+        request = self.get_request(authenticated=False)
+        data = {'results': represent_recipes(
+            list(recipe_values(
+                Recipe.objects.order_by('-pub_date', 'id'), request
+            )[:self.page_size]),
+            request,
+        )}
+        content = JSONRenderer().render(data)
+        self.assertEqual(ORJSONRenderer().render(data), content)
+        for renderer in (JSONRenderer(), ORJSONRenderer()):
+            self.measure(
+                type(renderer).__name__, lambda: renderer.render(data)
+            )
+        self.report('без сжатия', f'{len(content) / 1024:.1f} КБ')
+        for encoding in COMPRESSORS:
+            compressed = compress(content, encoding)
+            self.report(encoding, f'{len(compressed) / 1024:.1f} КБ')
+            self.measure(
+                f'сжатие {encoding}', lambda: compress(content, encoding)
+            )
+
+    def test_cached_response(self):
+        cache.clear()
+        client = APIClient()
+        params = {'limit': self.page_size}
+        for encoding in ('identity', *COMPRESSORS):
+            client.get(RECIPES_URL, params, HTTP_ACCEPT_ENCODING=encoding)
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(
+                    RECIPES_URL, params, HTTP_ACCEPT_ENCODING=encoding
+                )
+            self.assertEqual(len(queries), 0)
+            self.report(
+                f'ответ из кэша, {encoding}',
+                f'{len(response.content) / 1024:.1f} КБ',
+            )
+            self.measure(
+                f'ответ из кэша, {encoding}',
+                lambda: client.get(
+                    RECIPES_URL, params, HTTP_ACCEPT_ENCODING=encoding
+                ),
+            )
@@ -0,0 +1,312 @@
+import threading
+from collections import Counter
+from unittest import skipIf
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import (APIClient, APIRequestFactory,
+                                 force_authenticate)
+from rest_framework.views import APIView
+
+from recipes.constants import IMAGE_VARIANTS
+from recipes.counters import reconcile_counters
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCartTotal, Tag)
+from recipes.representations import recipe_values, represent_recipes
+from recipes.serializers import RecipeSerializer
+
+User = get_user_model()
+
+RECIPES_URL = '/api/recipes/'
+
+
+class RecipeDataMixin:
+    """Авторы, теги, ингредиенты и рецепты с избранным, корзиной и
+    подписками."""
+
+    recipes_count = 12
+
+    @classmethod
+    def create_recipes(cls):
+        cls.users = [
+            User.objects.create_user(
+                username=f'user{number}', email=f'user{number}@foodgram.ru',
+                password='password', first_name='Имя', last_name='Фамилия',
+            )
+            for number in range(3)
+        ]
+        cls.user, *cls.authors = cls.users
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=color, slug=f'tag{number}'
+            )
+            for number, color in enumerate(('#ff0000', '#008000', '#0000ff'))
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(6)
+        ]
+        cls.recipes = []
+        for number in range(cls.recipes_count):
+            recipe = Recipe.objects.create(
+                author=cls.authors[number % 2], name=f'Рецепт {number}',
+                text='Описание', image=f'recipes/images/{number}.png',
+                cooking_time=number + 1,
+            )
+            recipe.tags.set(cls.tags[number % 3:number % 3 + 2])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1
+                )
+                for ingredient in cls.ingredients[number % 4:number % 4 + 3]
+            )
+            cls.recipes.append(recipe)
+        cls.user.favorites.add(*cls.recipes[::3])
+        cls.user.shopping_cart.add(*cls.recipes[::4])
+        cls.user.followings.add(cls.authors[0])
+        cls.token = Token.objects.create(user=cls.user)
+
+    def get_client(self, authenticated):
+        client = APIClient()
+        if authenticated:
+            client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        return client
+
+
+class RecipeQueryCountTest(RecipeDataMixin, TestCase):
+    """Число запросов к базе не зависит от числа рецептов на странице."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_recipes()
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_list_queries(self, authenticated, queries):
+        client = self.get_client(authenticated)
+        for limit in (2, self.recipes_count):
+            with self.subTest(limit=limit), self.assertNumQueries(queries):
+                response = client.get(RECIPES_URL, {'limit': limit})
+            self.assertEqual(len(response.json()['results']), limit)
+
+    def assert_detail_queries(self, authenticated, queries):
+        client = self.get_client(authenticated)
+        with self.assertNumQueries(queries):
+            response = client.get(f'{RECIPES_URL}{self.recipes[0].id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_anonymous(self):
+        self.assert_list_queries(authenticated=False, queries=5)
+
+    def test_list_authenticated(self):
+        self.assert_list_queries(authenticated=True, queries=6)
+
+    def test_detail_anonymous(self):
+        self.assert_detail_queries(authenticated=False, queries=4)
+
+    def test_detail_authenticated(self):
+        self.assert_detail_queries(authenticated=True, queries=5)
+
+
+class ResponseCacheTest(RecipeDataMixin, TestCase):
+    """Кэш ответов не отдаёт одному клиенту данные другого."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_recipes()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_browsable_api_not_cached(self):
+        for _ in range(2):
+            response = APIClient().get('/api/tags/', HTTP_ACCEPT='text/html')
+            self.assertIn('csrftoken', response.cookies)
+
+    @override_settings(ALLOWED_HOSTS=['host1', 'host2'])
+    def test_host_in_cache_key(self):
+        for host in ('host1', 'host2'):
+            response = APIClient().get(
+                RECIPES_URL, {'limit': 2}, HTTP_HOST=host
+            )
+            self.assertTrue(
+                response.json()['next'].startswith(f'http://{host}/')
+            )
+
+
+class RecipePaginationTest(RecipeDataMixin, TestCase):
+    """Курсорный режим не сбрасывает сортировку поиска."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_recipes()
+
+    def test_cursor(self):
+        response = APIClient().get(RECIPES_URL, {'cursor': '', 'limit': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [recipe.id for recipe in self.recipes[::-1][:5]],
+        )
+
+    def test_cursor_with_search(self):
+        response = APIClient().get(
+            RECIPES_URL, {'cursor': '', 'search': 'Рецепт'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.json())
+
+
+class SimilarRecipesTest(RecipeDataMixin, TestCase):
+    """Похожие рецепты несуществующего рецепта — 404."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_recipes()
+
+    def test_unknown_recipe(self):
+        for pk in ('abc', 0):
+            with self.subTest(pk=pk):
+                response = APIClient().get(f'{RECIPES_URL}{pk}/similar/')
+                self.assertEqual(response.status_code, 404)
+
+    def test_similar(self):
+        response = APIClient().get(
+            f'{RECIPES_URL}{self.recipes[0].id}/similar/'
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class RecipeRepresentationContractTest(RecipeDataMixin, TestCase):
+    """represent_recipes отдаёт ровно то же, что RecipeSerializer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_recipes()
+        for recipe in cls.recipes[::2]:
+            recipe.image_variants = {
+                'source': recipe.image.name,
+                **{
+                    variant: f'recipes/images/{variant}/{recipe.id}.jpg'
+                    for variant in IMAGE_VARIANTS
+                },
+            }
+            recipe.save(update_fields=('image_variants',))
+        Recipe.objects.filter(id=cls.recipes[1].id).update(image='')
+
+    def get_request(self, authenticated):
+        request = APIRequestFactory().get(RECIPES_URL)
+        if authenticated:
+            force_authenticate(request, user=self.user, token=self.token)
+        return APIView().initialize_request(request)
+
+    def test_identical_to_serializer(self):
+        recipes = Recipe.objects.order_by('id')
+        for authenticated in (False, True):
+            with self.subTest(authenticated=authenticated):
+                request = self.get_request(authenticated)
+                expected = RecipeSerializer(
+                    recipes.for_read(request.user), many=True,
+                    context={'request': request},
+                ).data
+                actual = represent_recipes(
+                    list(recipe_values(recipes, request)), request
+                )
+                self.assertEqual(
+                    JSONRenderer().render(actual),
+                    JSONRenderer().render(expected),
+                )
+
+
+@skipIf(
+    connection.vendor == 'sqlite',
+    'SQLite блокирует всю базу на запись, гонки не воспроизводятся.',
+)
+class ToggleConcurrencyTest(TransactionTestCase):
+    """Параллельные одинаковые запросы меняют связь ровно один раз."""
+
+    requests_count = 8
+
+    def setUp(self):
+        self.user, self.author = (
+            User.objects.create_user(
+                username=username, email=f'{username}@foodgram.ru',
+                password='password', first_name='Имя', last_name='Фамилия',
+            )
+            for username in ('user', 'author')
+        )
+        # Без изображения: фоновая обработка в тесте не нужна.
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание', image='',
+            cooking_time=10,
+        )
+        self.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г'
+        )
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.ingredient, amount=300
+        )
+        self.token = Token.objects.create(user=self.user)
+
+    def send_parallel(self, method, url):
+        barrier = threading.Barrier(self.requests_count)
+        statuses = []
+
+        def send():
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+            try:
+                barrier.wait()
+                statuses.append(getattr(client, method)(url).status_code)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=send) for _ in range(self.requests_count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return Counter(statuses)
+
+    def assert_toggles_once(self, url):
+        others = self.requests_count - 1
+        self.assertEqual(
+            self.send_parallel('post', url), Counter({201: 1, 400: others})
+        )
+        self.assert_consistent()
+        self.assertEqual(
+            self.send_parallel('delete', url), Counter({204: 1, 400: others})
+        )
+        self.assert_consistent()
+
+    def assert_consistent(self):
+        self.assertFalse(any(reconcile_counters(fix=False).values()))
+        in_cart = self.user.shopping_cart.filter(id=self.recipe.id).exists()
+        self.assertEqual(
+            list(
+                ShoppingCartTotal.objects.filter(user=self.user).values_list(
+                    'ingredient_id', 'amount'
+                )
+            ),
+            [(self.ingredient.id, 300)] if in_cart else [],
+        )
+
+    def test_favorite(self):
+        self.assert_toggles_once(f'{RECIPES_URL}{self.recipe.id}/favorite/')
+
+    def test_shopping_cart(self):
+        self.assert_toggles_once(
+            f'{RECIPES_URL}{self.recipe.id}/shopping_cart/'
+        )
+
+    def test_subscribe(self):
+        self.assert_toggles_once(f'/api/users/{self.author.id}/subscribe/')
@@ -0,0 +1,43 @@
+import time
+
+from django.core.cache import cache
+
+VERSION_KEY = 'model-version:{}'
+
+
+def _key(model):
+    return VERSION_KEY.format(model._meta.label_lower)
+
+
+def get_version(model):
+    """Текущая версия данных модели, общая для всех процессов."""
+    key = _key(model)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(models):
+    """Версии нескольких моделей за одно обращение к кэшу."""
+    keys = {_key(model): model for model in models}
+    versions = cache.get_many(keys)
+    for key, model in keys.items():
+        if key not in versions:
+            versions[key] = get_version(model)
+    return [versions[key] for key in keys]
+
+
+def bump_version(model):
+    """Инвалидирует всё, что построено на данных модели.
+
+    Версия — время изменения в наносекундах, поэтому по ней же
+    формируется заголовок Last-Modified.
+    """
+    key = _key(model)
+    version = time.time_ns()
+    previous = cache.get(key)
+    if previous is not None and previous >= version:
+        version = previous + 1
+    cache.set(key, version, timeout=None)
@@ -1,41 +1,71 @@
-from collections import defaultdict
-
-from django.http import HttpResponse
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
-from rest_framework import filters, generics, permissions, status, viewsets
-from rest_framework.decorators import api_view
+from rest_framework import generics, permissions, status, viewsets
+from rest_framework.decorators import action, api_view, renderer_classes
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
 from recipes.constants import SHOPPING_CART_FILENAME
-from recipes.filters import RecipeFilter
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.filters import RecipeFilter, get_tag_ids
+from recipes.ingredient_index import get_ingredient_index
+from recipes.mixins import VersionedResponseCacheMixin
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            SimilarRecipe, Tag)
+from recipes.pagination import (FeedPagination, PageLimitPagination,
+                                RecipePagination)
+from recipes.pantry_index import get_pantry_index
 from recipes.permissions import IsOwnerOrAdminOrReadOnly
-from recipes.serializers import (IngredientSerializer, RecipeSerializer,
+from recipes.renderers import (CSVShoppingListRenderer,
+                               PDFShoppingListRenderer,
+                               TxtShoppingListRenderer)
+from recipes.representations import recipe_values, represent_recipes
+from recipes.serializers import (IngredientSerializer, PantryQuerySerializer,
+                                 PantryRecipeSerializer, RecipeSerializer,
                                  RecipeShortSerializer, RecipeWriteSerializer,
                                  TagSerializer)
+from recipes.shopping_list import RENDERERS, get_shopping_list
+from users.membership import add_membership, remove_membership
+from users.views import MembershipBatchView
+
+User = get_user_model()
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(VersionedResponseCacheMixin, viewsets.ReadOnlyModelViewSet):
+    cache_models = (Tag,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (permissions.AllowAny,)
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(
+    VersionedResponseCacheMixin, viewsets.ReadOnlyModelViewSet
+):
+    cache_models = (Ingredient,)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (permissions.AllowAny,)
     pagination_class = None
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ('^name',)
+
+    def list(self, request, *args, **kwargs):
+        index = get_ingredient_index()
+        query = request.query_params.get(api_settings.SEARCH_PARAM)
+        limit = request.query_params.get('limit')
+        limit = int(limit) if limit is not None and limit.isdigit() else None
+        if query:
+            return Response(index.search(query, limit))
+        return Response(index.all()[:limit])
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(VersionedResponseCacheMixin, viewsets.ModelViewSet):
+    cache_models = (Recipe, RecipeIngredient, Ingredient, Tag, User)
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     permission_classes = (IsOwnerOrAdminOrReadOnly,)
+    pagination_class = RecipePagination
     filterset_class = RecipeFilter
 
     def create(self, request, *args, **kwargs):
@@ -69,87 +99,173 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return Response(result_serializer.data)
 
+    @action(detail=True, permission_classes=(permissions.AllowAny,))
+    def similar(self, request, pk=None):
+        """Рецепты с наибольшим числом общих ингредиентов и тегов."""
+        recipe = get_object_or_404(Recipe.objects.only('id'), id=pk)
+        entries = SimilarRecipe.objects.filter(
+            recipe=recipe
+        ).select_related('similar').only(
+            'similar', *(
+                f'similar__{field}'
+                for field in RecipeShortSerializer.Meta.fields
+            )
+        ).order_by('-score', '-similar_id')
+        return Response(
+            RecipeShortSerializer(
+                [entry.similar for entry in entries], many=True,
+                context={'request': request},
+            ).data
+        )
+
+    @action(detail=False, permission_classes=(permissions.AllowAny,))
+    def pantry(self, request):
+        """Рецепты по убыванию доли ингредиентов, которые есть в наличии."""
+        query = PantryQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        tag_ids = None
+        if params.get('tags'):
+            tag_ids = get_tag_ids(params['tags'])
+        matches = get_pantry_index().match(
+            params['ingredients'], tag_ids, params.get('cooking_time')
+        )
+        paginator = PageLimitPagination()
+        page = paginator.paginate_queryset(matches, request, view=self)
+        recipes = Recipe.objects.only(
+            *RecipeShortSerializer.Meta.fields
+        ).in_bulk([recipe_id for recipe_id, _, _ in page])
+        results = []
+        for recipe_id, matched, total in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            recipe.coverage = matched / total
+            recipe.missing_count = total - matched
+            results.append(recipe)
+        return paginator.get_paginated_response(
+            PantryRecipeSerializer(
+                results, many=True, context={'request': request}
+            ).data
+        )
+
+    def is_response_cacheable(self, request):
+        """Кэшируются только анонимные список и детальная страница.
+
+        Для анонимов флаги избранного и списка покупок всегда ложны, и
+        ответ зависит только от параметров запроса.
+        """
+        return (
+            super().is_response_cacheable(request)
+            and 'HTTP_AUTHORIZATION' not in request.META
+            and self.action_map.get('get') in ('list', 'retrieve',)
+        )
+
+    def list(self, request, *args, **kwargs):
+        rows = recipe_values(
+            self.filter_queryset(self.get_queryset()), request
+        )
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(
+                represent_recipes(page, request)
+            )
+        return Response(represent_recipes(rows, request))
+
+    def retrieve(self, request, *args, **kwargs):
+        row = get_object_or_404(
+            recipe_values(self.filter_queryset(self.get_queryset()), request),
+            pk=kwargs['pk'],
+        )
+        self.check_object_permissions(request, row)
+        return Response(represent_recipes([row], request)[0])
+
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve',):
             return RecipeSerializer
         return RecipeWriteSerializer
 
 
-class FavoriteView(generics.CreateAPIView, generics.DestroyAPIView):
+class FeedView(generics.ListAPIView):
+    """Лента рецептов авторов, на которых подписан пользователь."""
+
+    serializer_class = RecipeSerializer
+    pagination_class = FeedPagination
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_queryset(self):
+        return Recipe.objects.for_read(self.request.user)
+
+
+class RecipeRelationView(generics.CreateAPIView, generics.DestroyAPIView):
+    """Добавление рецепта в связь пользователя и удаление из неё."""
 
+    relation = None
     serializer_class = RecipeShortSerializer
-    queryset = Recipe.objects.all()
+    queryset = Recipe.objects.only(*RecipeShortSerializer.Meta.fields)
     permission_classes = (permissions.IsAuthenticated,)
 
+    @transaction.atomic
     def create(self, request, *args, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['recipe_id'])
-        if recipe in request.user.favorites.all():
+        recipe = get_object_or_404(self.get_queryset(), id=kwargs['recipe_id'])
+        if not add_membership(request.user, self.relation, recipe.id):
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        request.user.favorites.add(recipe)
         serializer = self.get_serializer(recipe)
         headers = self.get_success_headers(serializer.data)
         return Response(
             serializer.data, status=status.HTTP_201_CREATED, headers=headers
         )
 
+    @transaction.atomic
     def delete(self, request, *args, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['recipe_id'])
-        if recipe not in request.user.favorites.all():
+        if not remove_membership(
+                request.user, self.relation, kwargs['recipe_id']
+        ):
+            get_object_or_404(Recipe, id=kwargs['recipe_id'])
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        request.user.favorites.remove(recipe)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class ShoppingCartView(generics.CreateAPIView, generics.DestroyAPIView):
+class FavoriteView(RecipeRelationView):
+    relation = 'favorites'
 
-    serializer_class = RecipeShortSerializer
-    queryset = Recipe.objects.all()
-    permission_classes = [permissions.IsAuthenticated]
 
-    def create(self, request, *args, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['recipe_id'])
-        if recipe in request.user.shopping_cart.all():
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        request.user.shopping_cart.add(recipe)
-        serializer = self.get_serializer(recipe)
-        headers = self.get_success_headers(serializer.data)
-        return Response(
-            serializer.data, status=status.HTTP_201_CREATED, headers=headers
-        )
+class ShoppingCartView(RecipeRelationView):
+    relation = 'shopping_cart'
 
-    def delete(self, request, *args, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['recipe_id'])
-        if recipe not in request.user.shopping_cart.all():
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        request.user.shopping_cart.remove(recipe)
-        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class FavoriteBatchView(MembershipBatchView):
+    relation = 'favorites'
+    target_model = Recipe
+
+
+class ShoppingCartBatchView(MembershipBatchView):
+    relation = 'shopping_cart'
+    target_model = Recipe
 
 
 @api_view(['GET'])
+@renderer_classes((
+    TxtShoppingListRenderer, CSVShoppingListRenderer, PDFShoppingListRenderer,
+))
 def download_shopping_cart(request):
 
     if not request.auth:
         return Response(status=status.HTTP_401_UNAUTHORIZED)
 
-    ingredients_counted = request.user.shopping_cart.values_list(
-        'ingredients__ingredient', 'ingredients__amount'
-    )
-    total_amounts = defaultdict(int)
-    for ingredient, amount in ingredients_counted:
-        total_amounts[ingredient] += amount
-    ingredient_list = [
-        f'{ingredient.name} ({ingredient.measurement_unit}) — '
-        f'{total_amounts[ingredient.id]}\n'
-        for ingredient in Ingredient.objects.filter(id__in=total_amounts)
-    ]
-    response = HttpResponse(
-        ''.join(ingredient_list),
+    renderer = request.accepted_renderer
+    response = StreamingHttpResponse(
+        RENDERERS[renderer.format](
+            get_shopping_list(request.user).iterator()
+        ),
         status=status.HTTP_200_OK,
-        content_type='text/plain',
-        charset='UTF-8'
+        content_type=renderer.media_type,
     )
+    if renderer.charset:
+        response['Content-Type'] += f'; charset={renderer.charset}'
     response['Content-Disposition'] = (
-        f'attachment; filename={0}'.format(SHOPPING_CART_FILENAME))
+        f'attachment; filename={SHOPPING_CART_FILENAME}.{renderer.format}'
+    )
     return response
 
 
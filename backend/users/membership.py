@@ -0,0 +1,124 @@
+from django.db import connections, router
+from django.db.models.signals import m2m_changed
+from django.utils.functional import cached_property
+
+REQUEST_ATTRIBUTE = '_user_membership'
+
+
+class UserMembership:
+    """ID избранного, списка покупок и подписок пользователя.
+
+    Каждый набор загружается одним запросом при первом обращении.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    def _load(self, relation, source, target):
+        if not self.user.is_authenticated:
+            return frozenset()
+        through = getattr(type(self.user), relation).through
+        return frozenset(
+            through.objects.filter(
+                **{source: self.user.id}
+            ).values_list(target, flat=True)
+        )
+
+    @cached_property
+    def favorites(self):
+        return self._load('favorites', 'usermodel_id', 'recipe_id')
+
+    @cached_property
+    def shopping_cart(self):
+        return self._load('shopping_cart', 'usermodel_id', 'recipe_id')
+
+    @cached_property
+    def followings(self):
+        return self._load(
+            'followings', 'from_usermodel_id', 'to_usermodel_id'
+        )
+
+
+def get_user_membership(request):
+    """Возвращает общий для всего запроса UserMembership."""
+    membership = getattr(request, REQUEST_ATTRIBUTE, None)
+    if membership is None:
+        membership = UserMembership(request.user)
+        setattr(request, REQUEST_ATTRIBUTE, membership)
+    return membership
+
+
+def _send_m2m_changed(user, field, action, target_ids):
+    through = field.remote_field.through
+    m2m_changed.send(
+        sender=through, instance=user, action=action, reverse=False,
+        model=field.related_model, pk_set=set(target_ids),
+        using=router.db_for_write(through, instance=user),
+    )
+
+
+def _execute_returning(user, relation, sql, params):
+    field = type(user)._meta.get_field(relation)
+    through = field.remote_field.through
+    using = router.db_for_write(through, instance=user)
+    quote_name = connections[using].ops.quote_name
+    sql = sql.format(
+        table=quote_name(through._meta.db_table),
+        source=quote_name(field.m2m_column_name()),
+        target=quote_name(field.m2m_reverse_name()),
+    )
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return field, {row[0] for row in cursor.fetchall()}
+
+
+def add_memberships(user, relation, target_ids):
+    """Добавляет связи пользователя одним INSERT ... ON CONFLICT DO NOTHING.
+
+    Повторы отсекает уникальное ограничение промежуточной таблицы, поэтому
+    результат не зависит от гонок параллельных запросов. Возвращает
+    множество действительно добавленных ID.
+    """
+    target_ids = sorted(set(target_ids))
+    if not target_ids:
+        return set()
+    values = ', '.join(['(%s, %s)'] * len(target_ids))
+    field, added = _execute_returning(
+        user, relation,
+        f'INSERT INTO {{table}} ({{source}}, {{target}}) VALUES {values} '
+        f'ON CONFLICT DO NOTHING RETURNING {{target}}',
+        [value for target_id in target_ids for value in (user.id, target_id)],
+    )
+    if added:
+        _send_m2m_changed(user, field, 'post_add', added)
+    return added
+
+
+def remove_memberships(user, relation, target_ids):
+    """Удаляет связи пользователя одним DELETE.
+
+    Возвращает множество действительно удалённых ID.
+    """
+    target_ids = sorted(set(target_ids))
+    if not target_ids:
+        return set()
+    placeholders = ', '.join(['%s'] * len(target_ids))
+    field, removed = _execute_returning(
+        user, relation,
+        f'DELETE FROM {{table}} WHERE {{source}} = %s '
+        f'AND {{target}} IN ({placeholders}) RETURNING {{target}}',
+        [user.id, *target_ids],
+    )
+    if removed:
+        _send_m2m_changed(user, field, 'post_remove', removed)
+    return removed
+
+
+def add_membership(user, relation, target_id):
+    """Добавляет одну связь, возвращает False, если она уже существует."""
+    return bool(add_memberships(user, relation, (target_id,)))
+
+
+def remove_membership(user, relation, target_id):
+    """Удаляет одну связь, возвращает False, если удалять было нечего."""
+    return bool(remove_memberships(user, relation, (target_id,)))
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:12
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).values(field).annotate(
+                total=Count('*')
+            ).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    UserModel = apps.get_model('users', 'UserModel')
+    UserModel.objects.update(
+        recipes_count=count_subquery(Recipe.objects, 'author_id'),
+        followers_count=count_subquery(
+            UserModel.followings.through.objects, 'to_usermodel_id'
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_initial'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usermodel',
+            name='followers_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Количество подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='usermodel',
+            name='recipes_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Количество рецептов'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
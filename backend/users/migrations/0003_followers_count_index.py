@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usermodel',
+            name='followers_count',
+            field=models.IntegerField(db_index=True, default=0, editable=False, verbose_name='Количество подписчиков'),
+        ),
+    ]
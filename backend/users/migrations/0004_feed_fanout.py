@@ -0,0 +1,27 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def disable_popular_fanout(apps, schema_editor):
+    UserModel = apps.get_model('users', 'UserModel')
+    UserModel.objects.filter(
+        followers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).update(feed_fanout=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_followers_count_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usermodel',
+            name='feed_fanout',
+            field=models.BooleanField(default=True, editable=False, verbose_name='Рецепты раскладываются по лентам подписчиков'),
+        ),
+        migrations.RunPython(disable_popular_fanout, migrations.RunPython.noop),
+    ]
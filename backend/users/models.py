@@ -22,4 +22,15 @@ class UserModel(AbstractUser):
         verbose_name='Подписки',
         blank=True,
     )
+    recipes_count = models.IntegerField(
+        default=0, editable=False, verbose_name='Количество рецептов'
+    )
+    followers_count = models.IntegerField(
+        default=0, editable=False, db_index=True,
+        verbose_name='Количество подписчиков'
+    )
+    feed_fanout = models.BooleanField(
+        default=True, editable=False,
+        verbose_name='Рецепты раскладываются по лентам подписчиков'
+    )
     REQUIRED_FIELDS = ('first_name', 'last_name', 'email',)
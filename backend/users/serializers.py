@@ -2,6 +2,8 @@ from django.contrib.auth import get_user_model
 from djoser.serializers import UserCreateSerializer as BaseUserCreateSerializer
 from rest_framework import serializers
 
+from users.membership import get_user_membership
+
 User = get_user_model()
 
 
@@ -41,4 +43,8 @@ class UserSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         if not user.is_authenticated:
             return False
-        return user.followings.filter(id=obj.id).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.id in get_user_membership(
+            self.context['request']
+        ).followings
@@ -0,0 +1,78 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from recipes.counters import change_counter, update_m2m_counter
+from recipes.feed import update_fanout
+from recipes.models import Recipe
+from recipes.versions import bump_version
+
+User = get_user_model()
+
+
+@receiver(m2m_changed, sender=User.followings.through)
+def update_followers_count(sender, **kwargs):
+    update_m2m_counter(
+        User, 'followers_count', 'from_usermodel_id', 'to_usermodel_id',
+        sender=sender, **kwargs
+    )
+
+
+@receiver(m2m_changed, sender=User.followings.through)
+def update_authors_fanout(sender, instance, action, reverse, pk_set,
+                          **kwargs):
+    """Пересматривает раскладку лент авторов, у которых изменилось число
+    подписчиков, после коммита."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        author_ids = [instance.pk]
+    elif action == 'pre_clear':
+        author_ids = list(
+            sender.objects.filter(
+                from_usermodel_id=instance.pk
+            ).values_list('to_usermodel_id', flat=True)
+        )
+    else:
+        author_ids = list(pk_set)
+    transaction.on_commit(lambda: update_fanout(author_ids))
+
+
+@receiver(pre_delete, sender=User)
+def release_user_counters(sender, instance, **kwargs):
+    """Вычитает удаляемого пользователя из счётчиков рецептов и авторов."""
+    for relation, field in (
+            (User.favorites, 'favorites_count'),
+            (User.shopping_cart, 'shopping_cart_count'),
+    ):
+        change_counter(
+            Recipe.objects.filter(
+                pk__in=relation.through.objects.filter(
+                    usermodel_id=instance.pk
+                ).values('recipe_id')
+            ),
+            field, -1,
+        )
+    author_ids = list(
+        User.followings.through.objects.filter(
+            from_usermodel_id=instance.pk
+        ).values_list('to_usermodel_id', flat=True)
+    )
+    change_counter(
+        User.objects.filter(pk__in=author_ids), 'followers_count', -1
+    )
+    transaction.on_commit(lambda: update_fanout(author_ids))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_user_version(sender, update_fields=None, **kwargs):
+    """Инвалидирует кэш ответов с данными авторов.
+
+    Обновление last_login при входе профиль не меняет.
+    """
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    transaction.on_commit(lambda: bump_version(User))
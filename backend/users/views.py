@@ -1,9 +1,15 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from rest_framework import generics, permissions, status
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from recipes.serializers import UserFollowingSerializer
+from recipes.models import Recipe
+from recipes.serializers import (IdListSerializer, UserFollowingSerializer,
+                                 get_recipes_limit)
+from users.membership import (add_membership, add_memberships,
+                              remove_membership, remove_memberships)
 
 User = get_user_model()
 
@@ -17,6 +23,20 @@ class FollowListView(generics.ListAPIView):
     def get_queryset(self):
         return self.request.user.followings.order_by('id')
 
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            latest_recipes = Recipe.objects.only(
+                'id', 'author_id', 'name', 'image', 'image_variants',
+                'cooking_time', 'pub_date',
+            ).latest_by_authors(
+                [author.id for author in page],
+                get_recipes_limit(self.request),
+            )
+            for author in page:
+                author.latest_recipes = latest_recipes[author.id]
+        return page
+
 
 class FollowCreateDestroyView(generics.CreateAPIView, generics.DestroyAPIView):
     """Вью-класс для создания и удаления подписок."""
@@ -25,22 +45,106 @@ class FollowCreateDestroyView(generics.CreateAPIView, generics.DestroyAPIView):
     queryset = User.objects.all()
     permission_classes = [permissions.IsAuthenticated]
 
+    @transaction.atomic
     def create(self, request, *args, **kwargs):
-        follower = request.user
         following = get_object_or_404(User, id=kwargs['user_id'])
-        if follower == following or following in follower.followings.all():
+        if following.id == request.user.id or not add_membership(
+                request.user, 'followings', following.id
+        ):
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        follower.followings.add(following)
         serializer = self.get_serializer(following)
         headers = self.get_success_headers(serializer.data)
         return Response(
             serializer.data, status=status.HTTP_201_CREATED, headers=headers
         )
 
+    @transaction.atomic
     def delete(self, request, *args, **kwargs):
-        follower = request.user
-        following = get_object_or_404(User, id=kwargs['user_id'])
-        if follower == following or following not in follower.followings.all():
+        if not remove_membership(
+                request.user, 'followings', kwargs['user_id']
+        ):
+            get_object_or_404(User, id=kwargs['user_id'])
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        follower.followings.remove(following)
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class MembershipBatchView(APIView):
+    """Пакетное добавление и удаление связей пользователя.
+
+    Принимает {"ids": [...]}, изменения вносятся одним запросом.
+    Для каждого ID возвращается код, который вернул бы одиночный запрос.
+    """
+
+    relation = None
+    target_model = None
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_ids(self, request):
+        serializer = IdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return list(dict.fromkeys(serializer.validated_data['ids']))
+
+    def get_existing_ids(self, ids):
+        return set(
+            self.target_model.objects.filter(
+                id__in=ids
+            ).values_list('id', flat=True)
+        )
+
+    def is_allowed(self, target_id):
+        return True
+
+    @staticmethod
+    def get_response(ids, statuses):
+        return Response({
+            'results': [
+                {'id': target_id, 'status': statuses[target_id]}
+                for target_id in ids
+            ]
+        })
+
+    @transaction.atomic
+    def post(self, request, *args, **kwargs):
+        ids = self.get_ids(request)
+        existing = self.get_existing_ids(ids)
+        allowed = [
+            target_id for target_id in ids
+            if target_id in existing and self.is_allowed(target_id)
+        ]
+        added = add_memberships(request.user, self.relation, allowed)
+        statuses = {}
+        for target_id in ids:
+            if target_id not in existing:
+                statuses[target_id] = status.HTTP_404_NOT_FOUND
+            elif target_id in added:
+                statuses[target_id] = status.HTTP_201_CREATED
+            else:
+                statuses[target_id] = status.HTTP_400_BAD_REQUEST
+        return self.get_response(ids, statuses)
+
+    @transaction.atomic
+    def delete(self, request, *args, **kwargs):
+        ids = self.get_ids(request)
+        removed = remove_memberships(request.user, self.relation, ids)
+        existing = removed | self.get_existing_ids(
+            [target_id for target_id in ids if target_id not in removed]
+        )
+        statuses = {}
+        for target_id in ids:
+            if target_id in removed:
+                statuses[target_id] = status.HTTP_204_NO_CONTENT
+            elif target_id in existing:
+                statuses[target_id] = status.HTTP_400_BAD_REQUEST
+            else:
+                statuses[target_id] = status.HTTP_404_NOT_FOUND
+        return self.get_response(ids, statuses)
+
+
+class FollowBatchView(MembershipBatchView):
+    """Пакетная подписка на авторов и отписка от них."""
+
+    relation = 'followings'
+    target_model = User
+
+    def is_allowed(self, target_id):
+        return target_id != self.request.user.id